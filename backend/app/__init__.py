@@ -1,8 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
 from app.config import Config
+from app.functions.mongo import db, ensure_indexes
 from app.routes.upload import upload_bp
 from app.routes.chat import chat_bp
 from app.routes.auth import auth_bp
@@ -21,11 +20,9 @@ def create_app():
     
     app.config.from_object(Config)
 
-    mongo_client = MongoClient(app.config["MONGO_URI"], server_api=ServerApi("1"))
-
-    # Select the database
-    database_name = "try1"  # Replace with your actual database name
-    app.db = mongo_client[database_name]
+    # Shared client and pool (see app/functions/mongo.py)
+    app.db = db
+    ensure_indexes()
 
     # Define a collection (e.g., "users")
     app.users_collection = app.db["users"]
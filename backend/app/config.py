@@ -4,4 +4,102 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    MONGO_URI = os.getenv("MONGO_URI")
\ No newline at end of file
+    MONGO_URI = os.getenv("MONGO_URI")
+    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "try1")
+    # One pool per process, shared by every blueprint (or by the FastAPI app)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+    MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "300000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+
+    # Schema catalog cache used by the /query pipeline
+    CATALOG_MAX_ENTRIES = int(os.getenv("CATALOG_MAX_ENTRIES", "32"))
+    CATALOG_MAX_BYTES = int(os.getenv("CATALOG_MAX_BYTES", str(64 * 1024 * 1024)))
+    CATALOG_SAMPLE_ROWS = int(os.getenv("CATALOG_SAMPLE_ROWS", "5"))
+
+    # Read-only SQLite connection pool shared by every endpoint that queries a project database
+    SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+    SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", str(64 * 1024)))
+    SQLITE_IMMUTABLE = os.getenv("SQLITE_IMMUTABLE", "1") == "1"
+
+    # How agent steps are narrated for the UI: "template" (no LLM), "batch" (one LLM call) or "concurrent"
+    NARRATION_MODE = os.getenv("NARRATION_MODE", "batch")
+
+    # Question -> SQL cache in front of the NL-to-SQL chain
+    QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "1") == "1"
+    QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+
+    # SQL result cache shared by /query and the agent endpoints
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+    RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(16 * 1024 * 1024)))
+    RESULT_CACHE_SPILL_DIR = os.getenv("RESULT_CACHE_SPILL_DIR", "")  # empty disables spilling to disk
+    RESULT_CACHE_SPILL_MAX_BYTES = int(os.getenv("RESULT_CACHE_SPILL_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+    # Concurrency limits for the async /query path
+    DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    CHART_MAX_WORKERS = int(os.getenv("CHART_MAX_WORKERS", "1"))  # matplotlib's pyplot state is not thread-safe
+
+    # When /query charts are rendered: "background" (after the answer is sent), "on_demand" (on first poll) or "inline"
+    VISUALIZATION_MODE = os.getenv("VISUALIZATION_MODE", "background")
+    CHART_JOBS_MAX = int(os.getenv("CHART_JOBS_MAX", "1000"))
+
+    # Server-side pagination of query results
+    RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "500"))
+    RESULT_MAX_PAGE_SIZE = int(os.getenv("RESULT_MAX_PAGE_SIZE", "5000"))
+    RESULT_CURSOR_TTL = int(os.getenv("RESULT_CURSOR_TTL", "600"))
+    RESULT_MAX_OPEN_CURSORS = int(os.getenv("RESULT_MAX_OPEN_CURSORS", "256"))
+
+    # Execution guard for generated SQL (0 disables a limit)
+    QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "20"))
+    QUERY_MAX_VM_STEPS = int(os.getenv("QUERY_MAX_VM_STEPS", str(500 * 1000 * 1000)))  # SQLite opcodes, a proxy for rows scanned
+    QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "200000"))
+    QUERY_PROGRESS_INTERVAL = int(os.getenv("QUERY_PROGRESS_INTERVAL", "10000"))
+
+    # Schema pruning for NL-to-SQL prompts
+    PROMPT_TOP_TABLES = int(os.getenv("PROMPT_TOP_TABLES", "6"))
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))  # schema + sample rows, ~4 chars per token
+    PROMPT_SAMPLE_ROWS = int(os.getenv("PROMPT_SAMPLE_ROWS", "3"))
+    PROMPT_MAX_CELL_CHARS = int(os.getenv("PROMPT_MAX_CELL_CHARS", "60"))
+
+    # Distinct-value index of text columns, for grounding literals in generated SQL
+    VALUE_INDEX_MAX_DISTINCT = int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "2000"))
+    VALUE_INDEX_MAX_VALUE_CHARS = int(os.getenv("VALUE_INDEX_MAX_VALUE_CHARS", "64"))
+    VALUE_INDEX_MAX_HINTS = int(os.getenv("VALUE_INDEX_MAX_HINTS", "15"))
+    VALUE_INDEX_SNAP_CUTOFF = float(os.getenv("VALUE_INDEX_SNAP_CUTOFF", "0.8"))
+
+    # Speculative NL-to-SQL: race this many candidates on the first attempt (1 = sequential)
+    SQL_CANDIDATES = int(os.getenv("SQL_CANDIDATES", "1"))
+    SQL_CANDIDATE_TEMPERATURE = float(os.getenv("SQL_CANDIDATE_TEMPERATURE", "0.7"))
+
+    # Few-shot examples mined per project from past answers (question -> sqlQuery)
+    FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", "3"))
+    FEW_SHOT_MINE_LIMIT = int(os.getenv("FEW_SHOT_MINE_LIMIT", "2000"))  # most recent chat messages read per project
+    FEW_SHOT_REFRESH_SECONDS = float(os.getenv("FEW_SHOT_REFRESH_SECONDS", "300"))
+
+    # Per-chat store of recent results, so follow-up questions can run over them instead of the database
+    SESSION_MAX_RESULTS = int(os.getenv("SESSION_MAX_RESULTS", "3"))  # 0 disables the session store
+    SESSION_MAX_ROWS = int(os.getenv("SESSION_MAX_ROWS", "50000"))
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+    SESSION_MAX_CHATS = int(os.getenv("SESSION_MAX_CHATS", "256"))
+
+    # Sample rows of uploaded tables, kept in their own collection rather than in the project document
+    SAMPLE_ROWS = int(os.getenv("SAMPLE_ROWS", "1000"))
+    SAMPLE_MAX_BYTES = int(os.getenv("SAMPLE_MAX_BYTES", str(4 * 1024 * 1024)))  # per table, well under the 16 MB BSON limit
+
+    # Chat history is read newest-first in pages; tableData and agentSteps are fetched per message
+    MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+    MESSAGE_MAX_PAGE_SIZE = int(os.getenv("MESSAGE_MAX_PAGE_SIZE", "500"))
+
+    # Assistant result rows beyond RESULT_INLINE_ROWS are stored once, compressed, in GridFS
+    RESULT_INLINE_ROWS = int(os.getenv("RESULT_INLINE_ROWS", "20"))  # also the size of the stored preview
+    RESULT_STORE_BUCKET = os.getenv("RESULT_STORE_BUCKET", "results")
+
+    # Write-behind queue for chat messages and logs ("batch", or "sync" to insert immediately, e.g. in tests)
+    WRITE_BEHIND_MODE = os.getenv("WRITE_BEHIND_MODE", "batch")
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+    WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+    WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+from app.config import Config
+from app.functions.visualize_with_db import avisualise
+
+PENDING = "pending"
+RENDERING = "rendering"
+READY = "ready"
+FAILED = "failed"
+
+
+class ChartJob:
+    def __init__(self, viz_id: str, result: Dict, output_path: str, url: str):
+        self.id = viz_id
+        self.result = result
+        self.output_path = output_path
+        self.url = url
+        self.status = PENDING
+        self.task: Optional[asyncio.Task] = None
+        self.on_done: Optional[Callable[["ChartJob"], Awaitable[None]]] = None
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "status": self.status, "url": self.url if self.status == READY else None}
+
+
+# Most recent finished jobs, and every job not finished yet; older ids fall back to what was stored in Mongo
+_jobs: "OrderedDict[str, ChartJob]" = OrderedDict()
+_lock = threading.Lock()
+# Strong references to in-flight renders so they aren't garbage collected mid-way
+_running = set()
+
+
+def create_job(result: Dict, output_path: str, url: str, viz_id: Optional[str] = None) -> ChartJob:
+    """
+    Register a chart to be rendered later; nothing runs until start_job or
+    ensure_started. Past CHART_JOBS_MAX jobs the oldest finished ones are
+    forgotten; pending and rendering jobs are always kept.
+    """
+    job = ChartJob(viz_id or str(uuid.uuid4()), {"columns": list(result["columns"]), "data": result["data"]}, output_path, url)
+    with _lock:
+        _jobs[job.id] = job
+        excess = len(_jobs) - Config.CHART_JOBS_MAX
+        for old_id in [old_id for old_id, old in _jobs.items() if old.status in (READY, FAILED)][:max(0, excess)]:
+            del _jobs[old_id]
+    return job
+
+
+def get_job(viz_id: str) -> Optional[ChartJob]:
+    with _lock:
+        return _jobs.get(viz_id)
+
+
+async def _render(job: ChartJob) -> None:
+    job.status = RENDERING
+    try:
+        output = await avisualise(job.result, job.output_path)
+        job.status = READY if output else FAILED
+    except Exception as e:
+        print("Chart rendering failed:", e)
+        job.status = FAILED
+    # The rows are only needed for rendering
+    job.result = None
+    if job.on_done is not None:
+        try:
+            await job.on_done(job)
+        except Exception as e:
+            print("Chart completion callback failed:", e)
+
+
+def ensure_started(job: ChartJob) -> asyncio.Task:
+    """Start rendering a job (once) on the running event loop."""
+    if job.task is None:
+        job.task = asyncio.get_running_loop().create_task(_render(job))
+        _running.add(job.task)
+        job.task.add_done_callback(_running.discard)
+    return job.task
+
+
+def start_job(job: ChartJob, on_done: Optional[Callable[[ChartJob], Awaitable[None]]] = None) -> Optional[asyncio.Task]:
+    """
+    Hand a job to the background worker according to VISUALIZATION_MODE.
+    In on_demand mode the job waits for its first status request instead.
+    """
+    job.on_done = on_done
+    if Config.VISUALIZATION_MODE == "on_demand":
+        return None
+    return ensure_started(job)
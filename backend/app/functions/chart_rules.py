@@ -0,0 +1,173 @@
+import re
+import threading
+from typing import Dict, Optional
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from app.functions.query_result import QueryResult
+
+# Results with these shapes are charted directly with matplotlib; anything else goes to the LLM
+MAX_BAR_CATEGORIES = 30
+MAX_LINE_SERIES = 4
+MIN_HISTOGRAM_ROWS = 10
+
+DATE_NAME_RE = re.compile(r"(date|time|day|month|year|week|quarter|period|created|updated)", re.IGNORECASE)
+DATE_VALUE_RE = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}(:\d{2})?)?")
+
+_stats_lock = threading.Lock()
+_stats = {"fast_path": 0, "llm_fallback": 0, "render_errors": 0, "kinds": {}}
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_date(series: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    values = series.dropna()
+    if values.empty:
+        return False
+    if _is_numeric(series):
+        # Integer years, e.g. "year" -> 2019, 2020, ...
+        return bool(DATE_NAME_RE.search(str(series.name))) and values.between(1900, 2100).all() and (values % 1 == 0).all()
+    sample = values.astype(str).head(20)
+    return sample.map(lambda v: bool(DATE_VALUE_RE.match(v))).all()
+
+
+def classify_chart(df: pd.DataFrame) -> Optional[str]:
+    """
+    Pick a chart type from the result's shape: column kinds, cardinality and
+    row count. Returns "kpi", "line", "bar", "scatter", "histogram" or None
+    when the shape isn't one the rules understand.
+    """
+    df = df.dropna(axis=1, how="all")
+    rows, cols = df.shape
+    if rows == 0 or cols == 0:
+        return None
+
+    dates = [c for c in df.columns if _is_date(df[c])]
+    numeric = [c for c in df.columns if _is_numeric(df[c]) and c not in dates]
+    other = [c for c in df.columns if c not in dates and c not in numeric]
+
+    if rows == 1 and numeric and len(numeric) == cols and cols <= 4:
+        return "kpi"
+    if len(dates) == 1 and numeric and not other and len(numeric) <= MAX_LINE_SERIES and rows >= 2:
+        return "line"
+    if len(other) == 1 and len(numeric) == 1 and not dates:
+        categories = df[other[0]]
+        if categories.nunique() == rows and rows <= MAX_BAR_CATEGORIES:
+            return "bar"
+        return None
+    if len(numeric) == 2 and cols == 2 and rows >= 3:
+        return "scatter"
+    if len(numeric) == 1 and cols == 1 and rows >= MIN_HISTOGRAM_ROWS:
+        return "histogram"
+    return None
+
+
+def _label(name) -> str:
+    return str(name).replace("_", " ").title()
+
+
+def render_chart(df: pd.DataFrame, kind: str, output_path: str) -> str:
+    df = df.dropna(axis=1, how="all")
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+
+    if kind == "kpi":
+        ax.axis("off")
+        row = df.iloc[0]
+        for i, col in enumerate(df.columns):
+            x = (i + 0.5) / len(df.columns)
+            value = row[col]
+            text = f"{value:,.2f}".rstrip("0").rstrip(".") if isinstance(value, float) else f"{value:,}"
+            ax.text(x, 0.55, text, ha="center", va="center", fontsize=36, fontweight="bold", color="#2563eb")
+            ax.text(x, 0.3, _label(col), ha="center", va="center", fontsize=14, color="#4b5563")
+    elif kind == "line":
+        date_col = next(c for c in df.columns if _is_date(df[c]))
+        data = df.copy()
+        if not _is_numeric(data[date_col]):
+            data[date_col] = pd.to_datetime(data[date_col], errors="coerce")
+        data = data.dropna(subset=[date_col]).sort_values(date_col)
+        for col in [c for c in data.columns if c != date_col]:
+            ax.plot(data[date_col], data[col], marker="o" if len(data) <= 50 else None, label=_label(col))
+        ax.set_xlabel(_label(date_col))
+        if len(data.columns) > 2:
+            ax.legend()
+        else:
+            ax.set_ylabel(_label(data.columns[1] if data.columns[0] == date_col else data.columns[0]))
+        fig.autofmt_xdate()
+    elif kind == "bar":
+        cat_col = next(c for c in df.columns if not _is_numeric(df[c]))
+        num_col = next(c for c in df.columns if c != cat_col)
+        data = df.sort_values(num_col, ascending=False)
+        labels = data[cat_col].astype(str)
+        if labels.str.len().max() > 12 or len(data) > 10:
+            ax.barh(labels[::-1], data[num_col][::-1], color="#2563eb")
+            ax.set_xlabel(_label(num_col))
+            ax.set_ylabel(_label(cat_col))
+        else:
+            ax.bar(labels, data[num_col], color="#2563eb")
+            ax.set_xlabel(_label(cat_col))
+            ax.set_ylabel(_label(num_col))
+    elif kind == "scatter":
+        x_col, y_col = df.columns[0], df.columns[1]
+        ax.scatter(df[x_col], df[y_col], alpha=0.7, color="#2563eb")
+        ax.set_xlabel(_label(x_col))
+        ax.set_ylabel(_label(y_col))
+    elif kind == "histogram":
+        col = df.columns[0]
+        ax.hist(df[col].dropna(), bins=min(30, max(5, len(df) // 5)), color="#2563eb", edgecolor="white")
+        ax.set_xlabel(_label(col))
+        ax.set_ylabel("Count")
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    if kind != "kpi":
+        ax.set_title(" vs ".join(_label(c) for c in df.columns[:3]))
+        ax.grid(alpha=0.3)
+        for side in ("top", "right"):
+            ax.spines[side].set_visible(False)
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=150)
+    return output_path
+
+
+def try_fast_chart(df: pd.DataFrame, output_path: str) -> Optional[str]:
+    """
+    Render the chart with the rules when the result's shape allows it.
+    Returns the output path, or None if the caller should fall back to the LLM.
+    """
+    kind = None
+    try:
+        kind = classify_chart(df)
+        if kind is not None:
+            render_chart(df, kind, output_path)
+    except Exception as e:
+        print("Rule-based chart failed, falling back to LLM:", e)
+        with _stats_lock:
+            _stats["render_errors"] += 1
+        kind = None
+
+    with _stats_lock:
+        if kind is None:
+            _stats["llm_fallback"] += 1
+            return None
+        _stats["fast_path"] += 1
+        _stats["kinds"][kind] = _stats["kinds"].get(kind, 0) + 1
+    return output_path
+
+
+def results_to_dataframe(results) -> pd.DataFrame:
+    """DataFrame from a QueryResult or a /query result dict ({"columns": [...], "data": [...]})."""
+    if isinstance(results, QueryResult):
+        return results.to_dataframe()
+    return pd.DataFrame(results.get("data", []), columns=results.get("columns") or None)
+
+
+def chart_stats() -> Dict:
+    with _stats_lock:
+        total = _stats["fast_path"] + _stats["llm_fallback"]
+        return {**_stats, "kinds": dict(_stats["kinds"]), "fast_path_rate": (_stats["fast_path"] / total) if total else 0.0}
@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.config import Config
+from app.functions.result_store import load_table_data
+
+# Fields sent with every message of a page; the heavy ones are left in Mongo
+MESSAGE_FIELDS = {
+    "id": 1, "chat_id": 1, "role": 1, "content": 1, "timestamp": 1, "currentStep": 1, "sqlQuery": 1,
+    "explanation": 1, "tableColumns": 1, "visualization": 1, "visualizationId": 1, "visualizationStatus": 1,
+    "followUpSuggestions": 1,
+}
+# Fetched per message on demand (GET .../messages/<message_id>)
+DETAIL_FIELDS = {"agentSteps": 1, "tableData": 1, "tableRef": 1, "tablePreview": 1, "tableColumns": 1}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _size(field: str) -> Dict:
+    return {"$cond": [{"$isArray": f"${field}"}, {"$size": f"${field}"}, 0]}
+
+
+def encode_cursor(message: Dict) -> str:
+    key = [message["timestamp"].isoformat(), str(message["_id"])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), ObjectId(message_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def page_size(limit: Optional[int]) -> int:
+    if not limit or limit <= 0:
+        return Config.MESSAGE_PAGE_SIZE
+    return min(limit, Config.MESSAGE_MAX_PAGE_SIZE)
+
+
+def message_page(chats, chat_id: str, before: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+    """
+    The newest `limit` messages of a chat older than the `before` cursor, in
+    chronological order. Keyset pagination on (timestamp, _id) walks the
+    (chat_id, timestamp, _id) index, so a page costs the same at any depth.
+    `before` in the result is the cursor for the next older page, or None.
+    """
+    limit = page_size(limit)
+    match = {"chat_id": chat_id}
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        match["$or"] = [{"timestamp": {"$lt": timestamp}},
+                        {"timestamp": timestamp, "_id": {"$lt": message_id}}]
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"timestamp": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        # Sizes of the fields left out, so the client knows what it can fetch
+        {"$project": {**MESSAGE_FIELDS, "stepCount": _size("agentSteps"),
+                      "tableRowCount": {"$ifNull": ["$tableRowCount", _size("tableData")]}}},
+    ]
+    messages: List[Dict] = list(chats.aggregate(pipeline))
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_before = encode_cursor(messages[-1]) if has_more else None
+    for message in messages:
+        message["_id"] = str(message["_id"])
+    messages.reverse()
+    return {"messages": messages, "before": next_before, "has_more": has_more}
+
+
+def message_details(chats, chat_id: str, message_id: str) -> Optional[Dict]:
+    """agentSteps and tableData of one message, or None if it doesn't exist in this chat."""
+    try:
+        oid = ObjectId(message_id)
+    except InvalidId:
+        return None
+    message = chats.find_one({"_id": oid, "chat_id": chat_id}, DETAIL_FIELDS)
+    if message is None:
+        return None
+    return {
+        "_id": str(message["_id"]),
+        "agentSteps": message.get("agentSteps", []),
+        "tableColumns": message.get("tableColumns", []),
+        "tableData": load_table_data(chats.database, message),
+    }
@@ -0,0 +1,37 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict
+from app.config import Config
+
+# Bounded thread pools so blocking work never runs on the event loop and can't
+# spawn an unbounded number of threads under load
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=Config.DB_MAX_WORKERS, thread_name_prefix="sqlite")
+CHART_EXECUTOR = ThreadPoolExecutor(max_workers=Config.CHART_MAX_WORKERS, thread_name_prefix="chart")
+
+# One semaphore per event loop (tests and workers may run several loops)
+_llm_semaphores: Dict[int, asyncio.Semaphore] = {}
+
+
+async def run_db(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking database call on the bounded DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, partial(fn, *args, **kwargs))
+
+
+async def run_chart(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run blocking chart rendering on the chart executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(CHART_EXECUTOR, partial(fn, *args, **kwargs))
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Limit how many LLM requests this process has in flight at once."""
+    loop_id = id(asyncio.get_running_loop())
+    semaphore = _llm_semaphores.get(loop_id)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop_id] = asyncio.Semaphore(Config.LLM_MAX_CONCURRENCY)
+    async with semaphore:
+        yield
@@ -0,0 +1,186 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from app.config import Config
+
+
+def _file_signature(db_path: str) -> Tuple[int, int]:
+    st = os.stat(db_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def open_readonly(db_path: str) -> sqlite3.Connection:
+    """
+    Open a tuned, read-only connection to an uploaded project database.
+
+    Uploaded files are never written by the app, so they are opened with
+    mode=ro (and immutable=1 unless SQLITE_IMMUTABLE=0), which lets SQLite
+    skip locking and change detection entirely.
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    if Config.SQLITE_IMMUTABLE:
+        uri += "&immutable=1"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_KIB};")
+    conn.execute("PRAGMA query_only=1;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of read-only connections to a single SQLite file."""
+
+    def __init__(self, db_path: str, signature: Tuple[int, int], size: int):
+        self.db_path = db_path
+        self.signature = signature
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._waiting = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "opens": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "in_use": 0}
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.stats["hits"] += 1
+                self.stats["in_use"] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                conn = open_readonly(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+            with self._lock:
+                self.stats["opens"] += 1
+                self.stats["in_use"] += 1
+            return conn
+
+        # Pool exhausted: wait for another request to hand a connection back
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        try:
+            conn = self._idle.get(timeout=Config.SQLITE_POOL_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"Timed out waiting for a database connection to {self.db_path}")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                drain = self._closed and not self._waiting
+            # A connection handed back for a waiter of a closed pool that gave up
+            if drain:
+                self._drain()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.stats["waits"] += 1
+            self.stats["wait_seconds"] += waited
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+            self.stats["in_use"] += 1
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self.stats["in_use"] -= 1
+            # Checked out when the pool was closed: close it now unless someone is still waiting
+            keep = not self._closed or self._waiting
+            if keep:
+                self._idle.put(conn)
+        if not keep:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self) -> None:
+        """Close the idle connections now and the checked-out ones as they are returned."""
+        with self._lock:
+            self._closed = True
+        self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_engines: Dict[str, Tuple[Tuple[int, int], object]] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Return the pool for a database file, replacing it if the file changed on disk."""
+    key = os.path.abspath(db_path)
+    signature = _file_signature(key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.signature != signature:
+            if pool is not None:
+                pool.close()
+            pool = ConnectionPool(key, signature, Config.SQLITE_POOL_SIZE)
+            _pools[key] = pool
+        return pool
+
+
+@contextmanager
+def pooled_connection(db_path: str):
+    """Borrow a read-only sqlite3 connection for the duration of a with-block."""
+    with get_pool(db_path).connection() as conn:
+        yield conn
+
+
+def get_engine(db_path: str):
+    """
+    SQLAlchemy engine (for langchain's SQLDatabase) whose connections are
+    opened with the same read-only URI and PRAGMAs as the sqlite3 pool.
+    """
+    key = os.path.abspath(db_path)
+    signature = _file_signature(key)
+    with _pools_lock:
+        cached = _engines.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if cached is not None:
+            cached[1].dispose()
+        engine = create_engine(
+            "sqlite://",
+            creator=lambda: open_readonly(key),
+            poolclass=QueuePool,
+            pool_size=Config.SQLITE_POOL_SIZE,
+            max_overflow=0,
+            pool_timeout=Config.SQLITE_POOL_TIMEOUT,
+        )
+        _engines[key] = (signature, engine)
+        return engine
+
+
+def pool_stats() -> Dict[str, Dict]:
+    with _pools_lock:
+        return {path: {**pool.stats, "opened": pool._opened, "size": pool.size} for path, pool in _pools.items()}
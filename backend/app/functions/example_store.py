@@ -0,0 +1,204 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from langchain_core.example_selectors import BaseExampleSelector
+from app.config import Config
+from app.functions.query_cache import normalize_question
+from app.functions.schema_context import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Long answers are cut so a few examples can't blow the prompt budget
+MAX_EXAMPLE_SQL_CHARS = 800
+
+# Generic examples for projects that have no answered questions yet
+PLACEHOLDER_EXAMPLES = [
+    {
+        "input": "New question: list recent entries from table1",
+        "answer": "SELECT * FROM table1 ORDER BY created_at DESC LIMIT 5;"
+    },
+    {
+        "input": "Continue question: filter above by status = 'active'",
+        "answer": "SELECT * FROM table1 WHERE status = 'active' ORDER BY created_at DESC LIMIT 5;"
+    }
+]
+
+_stats_lock = threading.Lock()
+_stats = {"mined_messages": 0, "examples_added": 0, "lookups": 0, "hits": 0, "placeholder": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+class ExampleIndex:
+    """
+    (question, SQL) pairs that worked for one project, searchable with BM25
+    over the question text. Documents are only ever appended (a re-asked
+    question replaces its SQL), so the inverted index is updated in place.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.docs: List[Counter] = []
+        self.lengths: List[int] = []
+        self.by_question: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.total_length = 0
+        # Mining state: newest message seen and a user question still waiting for its answer
+        self.last_timestamp = None
+        self.pending_question: Optional[str] = None
+        self.refreshed_at = 0.0
+
+    def add(self, question: str, sql: str) -> None:
+        key = normalize_question(question)
+        if not key or not sql:
+            return
+        sql = sql.strip()[:MAX_EXAMPLE_SQL_CHARS]
+        with self.lock:
+            existing = self.by_question.get(key)
+            if existing is not None:
+                self.answers[existing] = sql
+                return
+            doc = Counter(tokenize(question))
+            i = len(self.docs)
+            self.questions.append(question.strip())
+            self.answers.append(sql)
+            self.docs.append(doc)
+            self.lengths.append(sum(doc.values()))
+            self.by_question[key] = i
+            self.total_length += sum(doc.values())
+            for token in doc:
+                self.postings.setdefault(token, []).append(i)
+        _count("examples_added")
+
+    def search(self, question: str, k: int) -> List[Tuple[float, int]]:
+        tokens = set(tokenize(question))
+        with self.lock:
+            n = len(self.docs)
+            if not n or not tokens:
+                return []
+            avg_len = self.total_length / n
+            scores: Dict[int, float] = {}
+            for token in tokens:
+                postings = self.postings.get(token, [])
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for i in postings:
+                    tf = self.docs[i][token]
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / (avg_len or 1))
+                    scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(((score, i) for i, score in scores.items()), key=lambda pair: (-pair[0], -pair[1]))[:k]
+
+    def feed(self, messages: Iterable[Dict]) -> None:
+        """Pair each user message with the next assistant message that carries SQL."""
+        for message in messages:
+            _count("mined_messages")
+            if message.get("timestamp") is not None:
+                self.last_timestamp = message["timestamp"]
+            if message.get("role") == "user":
+                self.pending_question = message.get("content")
+            elif message.get("role") == "assistant":
+                # Answers computed from a chat's stored results have SQL over result_N tables
+                if self.pending_question and message.get("sqlQuery") and not message.get("fromSession"):
+                    self.add(self.pending_question, message["sqlQuery"])
+                self.pending_question = None
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+
+_indexes: "OrderedDict[str, ExampleIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _index(project: str, create: bool = False) -> Optional[ExampleIndex]:
+    with _lock:
+        index = _indexes.get(project)
+        if index is not None:
+            _indexes.move_to_end(project)
+        elif create:
+            index = _indexes[project] = ExampleIndex()
+            while len(_indexes) > Config.CATALOG_MAX_ENTRIES:
+                _indexes.popitem(last=False)
+        return index
+
+
+async def load_examples(chat_collection, chat_id: str) -> ExampleIndex:
+    """
+    Make sure the example index of a project is in memory. The first call mines
+    the most recent FEW_SHOT_MINE_LIMIT messages of the chat; later calls (at
+    most every FEW_SHOT_REFRESH_SECONDS) only read messages newer than the
+    last one seen, which picks up answers stored by other workers.
+    """
+    index = _index(chat_id, create=True)
+    if time.monotonic() - index.refreshed_at < Config.FEW_SHOT_REFRESH_SECONDS:
+        return index
+    index.refreshed_at = time.monotonic()
+    query = {"chat_id": chat_id}
+    if index.last_timestamp is not None:
+        query["timestamp"] = {"$gt": index.last_timestamp}
+    # Only the fields needed for pairing; tableData and agentSteps stay in Mongo
+    cursor = chat_collection.find(query, {"_id": 0, "role": 1, "content": 1, "sqlQuery": 1, "fromSession": 1, "timestamp": 1})
+    try:
+        messages = await cursor.sort("timestamp", -1).limit(Config.FEW_SHOT_MINE_LIMIT).to_list(length=None)
+    except Exception:
+        index.refreshed_at = 0.0
+        raise
+    index.feed(reversed(messages))
+    return index
+
+
+def add_example(project: Optional[str], question: str, sql: str) -> None:
+    """Record a freshly answered question; a project not mined yet still gets its full history on first load."""
+    if project:
+        _index(project, create=True).add(question, sql)
+
+
+def select_examples(project: Optional[str], question: str, k: Optional[int] = None) -> List[Dict[str, str]]:
+    """The k past questions of this project most similar to `question`, as prompt examples."""
+    _count("lookups")
+    index = _index(project) if project else None
+    if index is None:
+        return []
+    matches = index.search(question, k or Config.FEW_SHOT_EXAMPLES)
+    if matches:
+        _count("hits")
+    # Most similar last, right above the question being asked
+    return [{"input": index.questions[i], "answer": index.answers[i]} for _, i in reversed(matches)]
+
+
+class ProjectExampleSelector(BaseExampleSelector):
+    """
+    Few-shot examples for the NL-to-SQL prompt, picked per project from past
+    answers. The prompt input must carry the project key as "project"; without
+    one (or with nothing similar yet) the generic placeholder examples are used.
+    """
+
+    def add_example(self, example: Dict[str, str]) -> None:
+        add_example(example.get("project"), example["input"], example["answer"])
+
+    def select_examples(self, input_variables: Dict[str, str]) -> List[Dict[str, str]]:
+        examples = select_examples(input_variables.get("project"), input_variables.get("input", ""))
+        if not examples:
+            _count("placeholder")
+            return PLACEHOLDER_EXAMPLES
+        # Examples are spliced into the template before it is formatted, so literal braces must be escaped
+        return [{key: value.replace("{", "{{").replace("}", "}}") for key, value in example.items()}
+                for example in examples]
+
+
+def example_store_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        stats["projects"] = len(_indexes)
+        stats["examples"] = sum(len(index) for index in _indexes.values())
+    stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+    return stats
@@ -2,6 +2,12 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI  # or another LLM provider
 from langchain_core.output_parsers import StrOutputParser
+import asyncio
+import json
+import re
+from typing import AsyncIterator, Dict, List, Optional
+from app.config import Config
+from app.functions.concurrency import llm_slot
 
 # Define your LLM
 llm = ChatOpenAI(temperature=0.4, model="gpt-4o-mini")  # replace with your model or use Ollama
@@ -45,6 +51,147 @@ def generate_nl_explanation(query: str, result: dict) -> str:
     response = explanation_chain.invoke({"query": query, "result_json": result_json})
     return response.content
 
+async def agenerate_nl_explanation(query: str, result: dict) -> str:
+    result_json = str(result)
+    async with llm_slot():
+        response = await explanation_chain.ainvoke({"query": query, "result_json": result_json})
+    return response.content
+
+async def stream_nl_explanation(query: str, result: dict) -> AsyncIterator[str]:
+    """Yield the explanation token by token as the LLM produces it."""
+    result_json = str(result)
+    async with llm_slot():
+        async for chunk in explanation_chain.astream({"query": query, "result_json": result_json}):
+            if chunk.content:
+                yield chunk.content
+
 def thinking_explanation(step: str) -> str:
     response = thinking_chain.invoke({"step": step})
-    return response.content
\ No newline at end of file
+    return response.content
+
+batch_thinking_template = """
+You are summarizing internal AI reasoning steps during a data analysis task.
+Below is a JSON list of steps that were just done, in order.
+
+Steps:
+{steps}
+
+For every step, respond with a single, clear, past-tense sentence summarizing it.
+Output exactly {count} lines, one per step, in the same order, with no numbering.
+"""
+
+batch_thinking_prompt = PromptTemplate.from_template(batch_thinking_template)
+
+# Chain
+batch_thinking_chain: Runnable = batch_thinking_prompt | llm
+
+
+def compact_step(step: Dict) -> Dict:
+    """
+    Reduce a pipeline step to the metadata needed to describe it.
+    Sample data, result rows and schema text are never sent to the LLM.
+    """
+    compact = {"step": step.get("step")}
+    if step.get("message"):
+        compact["message"] = step["message"][:200]
+    if step.get("tables"):
+        compact["tables"] = step["tables"][:20]
+    if step.get("sql_query"):
+        compact["sql_query"] = step["sql_query"][:500]
+    if step.get("cached"):
+        compact["cached"] = step["cached"]
+    if step.get("intent"):
+        compact["intent"] = step["intent"]
+    if step.get("candidates"):
+        compact["candidates"] = step["candidates"]
+    if step.get("fixes"):
+        compact["fixes"] = step["fixes"][:10]
+    if step.get("snapped"):
+        compact["snapped"] = [f"{c['from']} -> {c['to']}" for c in step["snapped"]][:5]
+    if step.get("error"):
+        compact["error"] = step["error"][:200]
+    if step.get("retries"):
+        compact["retries"] = step["retries"]
+    result = step.get("result")
+    if isinstance(result, dict) and "data" in result:
+        compact["row_count"] = len(result["data"])
+        compact["columns"] = list(result.get("columns", []))[:20]
+    return compact
+
+
+def template_narration(step: Dict) -> str:
+    """Deterministic, LLM-free one-line description of a compact step."""
+    name = step.get("step")
+    if name == "load_database":
+        tables = step.get("tables", [])
+        return f"Loaded the database schema and sample rows for {len(tables)} table(s)."
+    if name == "generate_query":
+        if step.get("cached"):
+            return "Reused a previously validated SQL query for this question."
+        if step.get("intent"):
+            return "Recognised a question about the database structure and answered it with a fixed query."
+        if step.get("snapped"):
+            return f"Generated an SQL query and matched {len(step['snapped'])} value(s) to ones stored in the data."
+        if step.get("candidates"):
+            return f"Generated {step['candidates']} SQL queries in parallel and kept the first one that worked."
+        return "Generated an SQL query for the question."
+    if name == "load_session":
+        return f"Answering from the {len(step.get('tables', []))} most recent result(s) of this chat instead of the full database."
+    if name == "session_fallback":
+        return "The previous results didn't cover this question, so it goes to the full database."
+    if name == "repair_query":
+        return f"Repaired the SQL query locally ({len(step.get('fixes', []))} fix(es)) without asking the model again."
+    if name == "validate_query":
+        return f"Checked the SQL query against the schema and rejected it before running: {step.get('error', '')}"
+    if name == "execute_query":
+        if "error" in step:
+            return f"Ran the SQL query, which failed: {step['error']}"
+        return f"Ran the SQL query and retrieved {step.get('row_count', 0)} row(s)."
+    if name == "retry":
+        return f"Retried query generation after an SQL error (attempt {step.get('retries', 1)})."
+    return f"Completed step {name}."
+
+
+async def _narrate_batch(compact_steps: List[Dict]) -> List[str]:
+    async with llm_slot():
+        response = await batch_thinking_chain.ainvoke({
+            "steps": json.dumps(compact_steps, default=str),
+            "count": len(compact_steps),
+        })
+    lines = [re.sub(r"^\s*(\d+[.)]|[-*])\s*", "", line).strip() for line in response.content.splitlines()]
+    lines = [line for line in lines if line]
+    if len(lines) != len(compact_steps):
+        # The model didn't keep one line per step; don't guess the alignment
+        return [template_narration(step) for step in compact_steps]
+    return lines
+
+
+async def _narrate_one(step: Dict):
+    async with llm_slot():
+        return await thinking_chain.ainvoke({"step": json.dumps(step, default=str)})
+
+
+async def _narrate_concurrent(compact_steps: List[Dict]) -> List[str]:
+    responses = await asyncio.gather(*[_narrate_one(step) for step in compact_steps])
+    return [response.content for response in responses]
+
+
+async def narrate_steps(steps: List[Dict], mode: Optional[str] = None) -> List[str]:
+    """
+    Return one progress sentence per pipeline step.
+
+    mode is "template" (no LLM), "batch" (a single LLM call for all steps) or
+    "concurrent" (one ainvoke per step, fanned out). Defaults to Config.NARRATION_MODE.
+    LLM failures fall back to the template descriptions.
+    """
+    mode = mode or Config.NARRATION_MODE
+    compact_steps = [compact_step(step) for step in steps]
+    if not compact_steps or mode == "template":
+        return [template_narration(step) for step in compact_steps]
+    try:
+        if mode == "concurrent":
+            return await _narrate_concurrent(compact_steps)
+        return await _narrate_batch(compact_steps)
+    except Exception as e:
+        print("Step narration failed, using templates:", e)
+        return [template_narration(step) for step in compact_steps]
\ No newline at end of file
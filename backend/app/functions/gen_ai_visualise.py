@@ -3,6 +3,7 @@ import pandas as pd
 import os
 import re
 from dotenv import load_dotenv
+from app.functions.chart_rules import try_fast_chart
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +22,10 @@ def visualise(df: pd.DataFrame, output_path, model_name="gemini-2.0-flash", max_
     Returns:
         None
     """
+    # Simple result shapes are charted directly without Gemini
+    if try_fast_chart(df, output_path):
+        return output_path
+
     try:
         data_description = df.to_string(index=False)
     except Exception as e:
@@ -5,14 +5,18 @@ from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
+from app.functions.sql_validator import format_errors, validate_on_connection
+from app.functions.sql_repair import repair_sql, schema_columns
+from app.functions.schema_catalog import get_catalog
+from app.functions.schema_context import build_schema_context
 
 # Load environment variables
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-def generate_sql_query(nl_query: str, db_schema: str, db_connection, model_name="gpt-4o-mini", max_retries=10) -> str:
+def generate_sql_query(nl_query: str, db_schema: str, db_connection, model_name="gpt-4o-mini", max_retries=10, db_path=None) -> str:
     """
-    Convert a natural language query into a valid SQL query using OpenAI and LangChain, retrying on execution errors.
+    Convert a natural language query into a valid SQL query using OpenAI and LangChain, retrying on validation errors.
 
     Args:
         nl_query (str): Natural language query describing the desired data retrieval.
@@ -20,10 +24,14 @@ def generate_sql_query(nl_query: str, db_schema: str, db_connection, model_name=
         db_connection: Database connection object.
         model_name (str): OpenAI model to use.
         max_retries (int): Max number of retry attempts.
+        db_path (str): Optional path of the database; when given, db_schema is replaced by the
+            tables relevant to nl_query (see schema_context), trimmed to the prompt token budget.
 
     Returns:
         str: Valid SQL query or None.
     """
+    if db_path:
+        db_schema = build_schema_context(get_catalog(db_path), nl_query).prompt_text()
     print("db Schama : ",db_schema)
     llm = ChatOpenAI(model=model_name, temperature=0.2, api_key=openai_api_key)
     parser = StrOutputParser()
@@ -79,11 +87,18 @@ def generate_sql_query(nl_query: str, db_schema: str, db_connection, model_name=
 
             sql_query = sql_match.group(1).strip()
 
-            # ✅ Try executing the SQL
-            cursor = db_connection.cursor()
-            cursor.execute(sql_query)
-            db_connection.commit()
-            print("✅ SQL executed successfully.")
+            # ✅ Check the SQL without running it: compile-only against the schema, SELECT only.
+            # The caller executes the returned query once.
+            errors = validate_on_connection(db_connection, sql_query)
+            if errors:
+                # Try a local fix before spending another LLM attempt
+                repaired, fixes = repair_sql(sql_query, errors, schema_columns(db_connection),
+                                             lambda sql: validate_on_connection(db_connection, sql))
+                if repaired is None:
+                    raise ValueError(format_errors(errors))
+                print("🔧 Repaired SQL locally:", fixes)
+                sql_query = repaired
+            print("✅ SQL validated successfully.")
             return sql_query
 
         except Exception as e:
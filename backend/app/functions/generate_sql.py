@@ -1,22 +1,23 @@
 import asyncio
-from typing import List, Dict, Optional
-from sqlalchemy import text
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from langchain_openai import ChatOpenAI
-from langchain.chains import create_sql_query_chain
-from langchain_community.utilities import SQLDatabase
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
-
-# Define the initial prompt and examples (same as your original)
-examples = [
-    {
-        "input": "New question: list recent entries from table1",
-        "answer": "SELECT * FROM table1 ORDER BY created_at DESC LIMIT 5;"
-    },
-    {
-        "input": "Continue question: filter above by status = 'active'",
-        "answer": "SELECT * FROM table1 WHERE status = 'active' ORDER BY created_at DESC LIMIT 5;"
-    }
-]
+from app.config import Config
+from app.functions.schema_catalog import get_catalog
+from app.functions.schema_context import build_schema_context
+from app.functions.value_index import get_value_index, snap_literals, value_hints
+from app.functions.query_cache import lookup_sql, store_sql, forget_sql
+from app.functions.result_pages import open_result_set, open_materialized, close_result_set
+from app.functions.concurrency import run_db, llm_slot
+from app.functions.query_guard import run_guarded
+from app.functions.sql_validator import format_errors, validate_sql
+from app.functions.sql_repair import clean_sql, repair_sql
+from app.functions.speculation import UsageCounter, race, record_run
+from app.functions.example_store import ProjectExampleSelector
+from app.functions.session_store import get_session, is_refinement, record_refinement, remember_result
+from app.functions.intent_router import record_intent_failure, route_question
 
 example_prompt = PromptTemplate(
     input_variables=["input", "answer"],
@@ -24,15 +25,17 @@ example_prompt = PromptTemplate(
 )
 
 PROMPT = FewShotPromptTemplate(
-    examples=examples,
+    # Past answers of the same project most similar to the question (see example_store)
+    example_selector=ProjectExampleSelector(),
     example_prompt=example_prompt,
-    input_variables=['input', 'table_info', 'sample_data', 'top_k', 'history'],
+    input_variables=['input', 'table_info', 'sample_data', 'value_hints', 'top_k', 'history'],
     prefix=(
         "You are an AI assistant that generates valid SQLite queries given a multi-table database. "
         "Use the conversation history for context. Only output the SQL query.\n\n"
         "Conversation History:\n{history}\n\n"
-        "Database schema (all tables):\n{table_info}\n\n"
-        "Sample rows from each table:\n{sample_data}\n"
+        "Database schema (tables relevant to the question):\n{table_info}\n\n"
+        "Sample rows from each table:\n{sample_data}\n\n"
+        "Values stored in the data that match words in the question (use them exactly):\n{value_hints}\n"
     ),
     suffix=(
         "Top K rows: {top_k}\n"
@@ -41,9 +44,28 @@ PROMPT = FewShotPromptTemplate(
     )
 )
 
+# Appended to the history when a follow-up is answered from the chat's stored results
+SESSION_INSTRUCTION = ("Answer using only the result tables above. "
+                       "If the question needs data they don't contain, output just: NONE")
+
+# Only the last HISTORY_WINDOW_SIZE history lines are sent to the LLM
+HISTORY_WINDOW_SIZE = 10
+
 # Create a shared LLM instance; you can adjust the model settings as needed
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
 
+
+def build_sql_chain(temperature: Optional[float] = None):
+    """
+    PROMPT -> LLM -> text. Same shape as create_sql_query_chain, but table_info
+    comes from our pruned schema context instead of db.get_table_info(), which
+    re-read every table (and its sample rows) from the database on each call.
+    """
+    options = {"stop": ["\nSQLResult:"]}
+    if temperature is not None:
+        options["temperature"] = temperature
+    return PROMPT | llm.bind(**options) | StrOutputParser()
+
 # Define the state type as a Python dictionary.
 def init_state(question: str) -> Dict:
     return {
@@ -51,121 +73,335 @@ def init_state(question: str) -> Dict:
         'history': [],
         'sql_query': "",
         'result': None,
+        'page': {},
         'retries': 0
     }
 
-async def async_query(query: str, db_type: str, db_url: str) -> List[Dict]:
+
+async def generate_candidate(inp: Dict, values, usage: UsageCounter,
+                             temperature: Optional[float] = None) -> Tuple[str, List[Dict]]:
+    """One LLM completion, cleaned up and with its literals snapped to stored values."""
+    chain = build_sql_chain(temperature)
+    usage.calls += 1
+    async with llm_slot():
+        sql_query = (await chain.ainvoke(inp, config={"callbacks": [usage]})).strip()
+    # Cleanup possible markdown formatting, labels and stray semicolons
+    sql_query, _ = clean_sql(sql_query)
+    # Literals the data doesn't contain ('active', 'Pariss') are snapped to the closest stored value
+    return snap_literals(values, sql_query)
+
+
+def check_candidate(catalog, sql_query: str) -> Tuple[str, List[Dict], Optional[str]]:
+    """
+    Check the SQL against the cached schema (compile only, no data is read).
+    Mechanical mistakes (near-miss names, wrong alias, MySQL functions) are
+    fixed locally and re-validated; only what can't be repaired costs another
+    LLM call. Returns (sql, steps, error message or None).
+    """
+    errors = validate_sql(catalog, sql_query)
+    if not errors:
+        return sql_query, [], None
+    repaired, fixes = repair_sql(sql_query, errors, catalog.columns, lambda sql: validate_sql(catalog, sql))
+    if repaired is not None:
+        return repaired, [{"step": "repair_query", "sql_query": repaired, "fixes": fixes}], None
+    error_msg = format_errors(errors)
+    return sql_query, [{"step": "validate_query", "error": error_msg, "errors": errors}], error_msg
+
+
+async def execute_candidate(db_url: str, sql_query: str) -> Tuple[Dict, Dict]:
+    """Run a validated query; returns (result, execute_query step)."""
+    try:
+        # Only the first page is materialized; the rest stays behind a server-side cursor.
+        # Identical SQL on an unchanged database is served from the shared result cache.
+        # The execution guard stops runaway SQL (and any statement whose request is cancelled);
+        # its error message tells the model how to make the next attempt cheaper.
+        page = await run_guarded(open_result_set, db_url, sql_query)
+    except Exception as e:
+        result = {"error": str(e)}
+        return result, {"step": "execute_query", "error": result["error"]}
+    return page_step(page)
+
+
+def page_step(page: Dict) -> Tuple[Dict, Dict]:
+    """(result, execute_query step) for a first page from result_pages."""
+    result = {"columns": page["columns"], "data": page["data"]}
+    return result, {
+        "step": "execute_query",
+        "result": result,
+        "page": {
+            "next_cursor": page["next_cursor"],
+            "total_rows": page["total_rows"],
+            "total_rows_exact": page["total_rows_exact"],
+            "truncated": page["truncated"],
+        }
+    }
+
+
+def _plausibility(outcome: Tuple) -> int:
+    # 2: ran and returned rows, 1: ran but came back empty, 0: rejected or failed
+    result = outcome[2]
+    if "error" in result:
+        return 0
+    return 2 if result["data"] else 1
+
+
+async def speculate(catalog, db_url: str, inp: Dict, values, usage: UsageCounter) -> Tuple[int, str, List[Dict], Dict]:
+    """
+    Generate SQL_CANDIDATES queries concurrently (the first at the model's
+    default temperature, the rest sampled hotter for diversity), then validate
+    and execute each as soon as it arrives. The first candidate that returns
+    rows wins and the others are cancelled; an empty result only wins if no
+    candidate returns rows. Returns (winner, sql, steps, result).
+    """
+    async def candidate(i: int):
+        temperature = None if i == 0 else Config.SQL_CANDIDATE_TEMPERATURE
+        sql_query, snapped = await generate_candidate(inp, values, usage, temperature)
+        generate_step = {"step": "generate_query", "sql_query": sql_query, "candidate": i}
+        if snapped:
+            generate_step["snapped"] = snapped
+        sql_query, steps, error_msg = check_candidate(catalog, sql_query)
+        steps = [generate_step] + steps
+        if error_msg is not None:
+            return sql_query, steps, {"error": error_msg}
+        result, execute_step = await execute_candidate(db_url, sql_query)
+        return sql_query, steps + [execute_step], result
+
+    count = Config.SQL_CANDIDATES
+    winner, (sql_query, steps, result), losers = await race(
+        [lambda i=i: candidate(i) for i in range(count)], _plausibility, best=2)
+    # Finished losers may hold a server-side cursor over the rest of their rows
+    for _, loser_steps, _ in losers:
+        cursor = loser_steps[-1].get("page", {}).get("next_cursor")
+        if cursor:
+            close_result_set(cursor)
+    steps[0]["candidates"] = count
+    return winner, sql_query, steps, result
+
+
+async def iter_session_steps(session, query: str, usage: UsageCounter) -> AsyncIterator[Dict]:
     """
-    Asynchronously process a SQL query generation and execution with retries.
-    
+    Answer a follow-up from the chat's stored results (small in-memory tables)
+    instead of the project database. One attempt only: a successful run ends
+    with an execute_query step; otherwise the last step is session_fallback and
+    the caller goes on with the full pipeline.
+    """
+    # Results longer than one page were only recorded; read them in now that they are needed
+    await run_db(session.materialize)
+    if not session.results:
+        yield {"step": "session_fallback", "error": "The previous results are too large to keep"}
+        return
+    yield {
+        "step": "load_session",
+        "message": "Using the previous results of this chat",
+        "tables": list(session.results)
+    }
+    inp = {
+        "input": query,
+        "history": "\n".join(session.history() + [SESSION_INSTRUCTION]),
+        "table_info": session.table_info(),
+        "sample_data": await run_db(session.sample_data, Config.PROMPT_SAMPLE_ROWS),
+        "value_hints": "(none)",
+        "top_k": 5,
+        "project": None
+    }
+    sql_query, _ = await generate_candidate(inp, None, usage)
+    yield {"step": "generate_query", "sql_query": sql_query, "session": True}
+
+    errors = session.validate(sql_query)
+    if errors:
+        repaired, fixes = repair_sql(sql_query, errors, session.columns, session.validate)
+        if repaired is None:
+            yield {"step": "session_fallback", "error": format_errors(errors)}
+            return
+        sql_query = repaired
+        yield {"step": "repair_query", "sql_query": sql_query, "fixes": fixes}
+    # Only SQL that reads the stored results (and nothing else) counts as an answer from them
+    read = session.tables_read(sql_query)
+    if not read or any(table not in session.results for table in read):
+        yield {"step": "session_fallback", "error": "The query does not read the previous results"}
+        return
+    try:
+        full = await run_guarded(session.run, sql_query)
+    except Exception as e:
+        yield {"step": "session_fallback", "error": str(e)}
+        return
+    page = await run_db(open_materialized, full, sql_query)
+    _, execute_step = page_step(page)
+    execute_step["session"] = True
+    yield execute_step
+    # Kept as well, so a drill-down can refine the refinement
+    await run_db(session.add, query, sql_query, full, True)
+
+
+async def iter_query_steps(query: str, db_type: str, db_url: str, chat_id: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    Asynchronously process a SQL query generation and execution with retries,
+    yielding each step (load_database, generate_query, execute_query, retry)
+    as soon as it happens.
+
+    With SQL_CANDIDATES > 1 the first attempt is speculative (see speculate);
+    retries always go back to one candidate at a time with the error in the history.
+
     Parameters:
       - query (str): The natural language query.
       - db_type (str): The type of database. (Currently only "sqlite" is handled.)
       - db_url (str): The URI/path for connecting to the database.
-    
-    Returns:
-      A list of steps (as dictionaries) representing what occurred on each step,
-      including any retries and the final result.
+      - chat_id (str): The project's chat. Its past answers are used as few-shot examples, and
+        its last results are kept so follow-ups like "now only 2024" run over those instead.
     """
-    steps: List[Dict] = []
+    started = time.perf_counter()
+    speculative = Config.SQL_CANDIDATES > 1
+    usage = UsageCounter()
+    session = get_session(chat_id)
 
-    # Step 1: Connect to the database. You can extend this branch based on db_type if needed.
+    # Step 1: Load the database catalog. You can extend this branch based on db_type if needed.
     if db_type.lower() == "sqlite":
-        db = SQLDatabase.from_uri(f"sqlite:///{db_url}")
+        # Schema, sample rows and the SQLDatabase handle are cached per file (see schema_catalog)
+        catalog = await run_db(get_catalog, db_url)
     else:
         raise ValueError("Only 'sqlite' database type is currently supported.")
 
-    # Get schema and sample data
-    table_info_str = db.get_table_info()
-    sample_data = {}
-    tables = db.get_usable_table_names()
-    for tbl in tables:
-        try:
-            cursor = db.run(f"SELECT * FROM {tbl} LIMIT 5;", fetch="cursor")
-            rows = cursor.mappings()
-            sample_data[tbl] = [dict(r) for r in rows]
-        except Exception:
-            sample_data[tbl] = []
+    # Schema, table-list, row-count and preview questions are answered from a SQL template, no LLM.
+    # They are about the database, so they are never treated as follow-ups.
+    intent = route_question(catalog, query)
+    # A question naming one of the database's tables is new, not a follow-up
+    follow_up = intent is None and session is not None and is_refinement(query, catalog.tables)
+    if follow_up:
+        answered = False
+        async for step in iter_session_steps(session, query, usage):
+            answered = step["step"] == "execute_query"
+            yield step
+        record_refinement(answered)
+        if answered:
+            record_run("speculative" if speculative else "sequential", time.perf_counter() - started, usage)
+            return
+
+    table_info_str = catalog.table_info
+    sample_data = catalog.sample_data
+    tables = catalog.tables
+    # Only the tables relevant to this question (plus their join path) go into the prompt
+    context = build_schema_context(catalog, query)
+    # Distinct values of text columns (built at upload time) ground literals like 'Active' or 'Paris'
+    values = await run_db(get_value_index, db_url)
 
-    steps.append({
+    yield {
         "step": "load_database",
         "message": "Database loaded successfully",
         "tables": tables,
         "table_info": table_info_str,
-        "sample_data": sample_data
-    })
+        "sample_data": sample_data,
+        "prompt_tables": context.tables
+    }
+
+    if intent is not None:
+        result, execute_step = await execute_candidate(db_url, intent.sql)
+        if "error" not in result:
+            yield {"step": "generate_query", "sql_query": intent.sql, "intent": intent.name, "table": intent.table}
+            yield execute_step
+            if chat_id:
+                await run_db(remember_result, chat_id, query, intent.sql, db_url, result, execute_step["page"])
+            return
+        record_intent_failure()
 
     # Initialize state
     state = init_state(query)
+    if follow_up:
+        # Going back to the database for a follow-up: the model still needs the earlier questions
+        state["history"].extend(session.database_history())
 
     # Retry loop with a limit of 3 retries
     MAX_RETRIES = 3
 
+    # A previously validated answer to the same (or a near-identical) question skips the LLM
+    cache_history = "\n".join(state['history'][-HISTORY_WINDOW_SIZE:])
+    cached = lookup_sql(db_url, catalog.signature, query, cache_history)
+
     while True:
-        # Step 2: Generate SQL query using the LLM chain.
-        chain = create_sql_query_chain(
-            llm=llm,
-            db=db,
-            prompt=PROMPT,
-            k=5
-        )
-        # Prepare the input; note that we take only the last HISTORY_WINDOW_SIZE lines.
-        HISTORY_WINDOW_SIZE = 10
-        inp = {
-            "question": state["question"],
-            "history": "\n".join(state['history'][-HISTORY_WINDOW_SIZE:]),
-            "table_info": table_info_str,
-            "sample_data": sample_data,
-            "top_k": 5
-        }
-        # Here we wrap the synchronous call in asyncio.to_thread to avoid blocking.
-        sql_query = await asyncio.to_thread(chain.invoke, inp)
-        # Cleanup possible markdown formatting
-        if sql_query.strip().startswith("```"):
-            sql_query = sql_query.strip("```").replace("sql", "").strip()
-        state["sql_query"] = sql_query
-        steps.append({
-            "step": "generate_query",
-            "sql_query": sql_query
-        })
-
-        # Step 3: Execute the SQL query.
-        try:
-            cursor = db.run(text(sql_query), fetch="cursor")
-            raw_rows = list(cursor.mappings())
-            rows = [dict(r) for r in raw_rows]
-            columns = list(rows[0].keys()) if rows else []
-            state["result"] = {"columns": columns, "data": rows}
-            steps.append({
-                "step": "execute_query",
-                "result": state["result"]
-            })
-        except Exception as e:
-            error_msg = str(e)
-            state["result"] = {"error": error_msg}
-            steps.append({
-                "step": "execute_query",
-                "error": error_msg
-            })
+        from_cache = cached is not None
+        if not from_cache:
+            # Prepare the LLM input; note that we take only the last HISTORY_WINDOW_SIZE lines.
+            inp = {
+                "input": state["question"],
+                "history": "\n".join(state['history'][-HISTORY_WINDOW_SIZE:]),
+                "table_info": context.table_info,
+                "sample_data": context.sample_data,
+                "value_hints": value_hints(values, state["question"], context.tables),
+                "top_k": 5,
+                "project": chat_id
+            }
+        if not from_cache and speculative and state["retries"] == 0:
+            # Steps 2-4 for several candidates at once; only the winner's steps are reported
+            _, sql_query, steps, state["result"] = await speculate(catalog, db_url, inp, values, usage)
+            state["sql_query"] = sql_query
+            state["page"] = steps[-1].get("page", {})
+            for step in steps:
+                yield step
+        else:
+            if from_cache:
+                sql_query = cached["sql"]
+                generate_step = {"step": "generate_query", "sql_query": sql_query, "cached": cached["match"]}
+            else:
+                # Step 2: Generate SQL query using the LLM chain.
+                sql_query, snapped = await generate_candidate(inp, values, usage)
+                generate_step = {"step": "generate_query", "sql_query": sql_query}
+                if snapped:
+                    generate_step["snapped"] = snapped
+            state["sql_query"] = sql_query
+            yield generate_step
+
+            # Step 3: Validate (and locally repair); only a candidate that passes is executed, and it is executed once.
+            sql_query, steps, error_msg = check_candidate(catalog, sql_query)
+            state["sql_query"] = sql_query
+            for step in steps:
+                yield step
+            if error_msg is not None:
+                state["result"] = {"error": error_msg}
+            else:
+                # Step 4: Execute the SQL query.
+                state["result"], execute_step = await execute_candidate(db_url, sql_query)
+                state["page"] = execute_step.get("page", {})
+                yield execute_step
+        sql_query = state["sql_query"]
+
+        if from_cache:
+            if "error" in state["result"]:
+                forget_sql(db_url, catalog.signature, cached["question"], cache_history)
+            cached = None
+        elif "error" not in state["result"]:
+            store_sql(db_url, catalog.signature, query, sql_query, cache_history)
 
         # Check if there was an SQL error and whether we should retry
         if "error" in state["result"] and state["retries"] < MAX_RETRIES:
             state["retries"] += 1
             retry_message = f"Retry {state['retries']}: SQL error encountered: {state['result']['error']}"
             state["history"].append(retry_message)
-            steps.append({
+            yield {
                 "step": "retry",
                 "message": retry_message,
                 "history": state["history"],
                 "retries": state["retries"]
-            })
-            # Optionally, yield control to let the caller process the step
-            await asyncio.sleep(0)
+            }
         else:
             # No error or reached maximum retries.
             break
 
-    return steps
+    if chat_id and "error" not in state["result"]:
+        try:
+            await run_db(remember_result, chat_id, query, state["sql_query"], db_url, state["result"], state["page"])
+        except Exception as e:
+            print("Could not keep the result for follow-ups:", e)
+
+    # Questions answered from the query cache never reach the LLM and aren't part of the comparison
+    if usage.calls:
+        record_run("speculative" if speculative else "sequential", time.perf_counter() - started, usage)
+
+
+async def async_query(query: str, db_type: str, db_url: str, chat_id: Optional[str] = None) -> List[Dict]:
+    """
+    Run the whole pipeline and return the list of steps (as dictionaries)
+    representing what occurred on each step, including any retries and the final result.
+    """
+    return [step async for step in iter_query_steps(query, db_type, db_url, chat_id)]
 
 # Example usage of the async_query function
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import re
+import threading
+from typing import Dict, List, Optional
+from app.functions.schema_context import tokenize
+
+# Rows shown for "show the first N rows of X" when no N is given, and the most we show
+DEFAULT_PREVIEW_ROWS = 10
+MAX_PREVIEW_ROWS = 1000
+
+_TABLE = r"(?:the )?[\"'`]?(?P<table>[\w.-]+)[\"'`]?(?: table)?"
+_DB = r"(?: (?:in|of) (?:the|this|my|our) (?:database|db|data))?"
+
+# (intent, pattern) pairs tried in order against the normalized question
+PATTERNS = [
+    ("row_counts", re.compile(r"^how many (?:rows|records|entries) (?:are )?(?:there )?(?:in|per) (?:each|every) table" + _DB + "$")),
+    ("row_counts", re.compile(r"^(?:show |list |give me |get )?(?:me )?(?:the )?(?:row|record) counts?(?: (?:of|for|per|in) (?:each|every|all(?: the)?) tables?)?" + _DB + "$")),
+    ("row_counts", re.compile(r"^(?:count|number of) (?:rows|records) (?:in|of|per|for) (?:each|every|all(?: the)?) tables?" + _DB + "$")),
+    ("list_tables", re.compile(r"^(?:list|show|display|what are|which are|give me|get)(?: me)?(?: all)?(?: of)?(?: the)? tables" + _DB + "$")),
+    ("list_tables", re.compile(r"^(?:what|which) tables (?:are there|exist|do (?:we|i) have|are (?:in|available))" + _DB + "$")),
+    ("schema", re.compile(r"^(?:show|display|describe|what is|give me|get)(?: me)?(?: the)? (?:database |db )?(?:schema|structure)" + _DB + "$")),
+    ("schema", re.compile(r"^describe (?:the|this|my) (?:database|db)$")),
+    ("table_schema", re.compile(r"^(?:show|display|describe|what is|what are|give me|get|list)(?: me)?(?: the)? (?:schema|structure|columns|fields) (?:of|for|in) " + _TABLE + "$")),
+    ("table_schema", re.compile(r"^what (?:columns|fields) (?:are in|does) " + _TABLE + "(?: have)?$")),
+    ("table_schema", re.compile(r"^describe " + _TABLE + "$")),
+    ("row_count", re.compile(r"^how many (?:rows|records|entries) (?:are )?(?:there )?in " + _TABLE + "$")),
+    ("row_count", re.compile(r"^(?:count|number of) (?:the )?(?:rows|records|entries) (?:in|of) " + _TABLE + "$")),
+    ("row_count", re.compile(r"^count (?:all )?(?:the )?(?:rows )?(?:in )?" + _TABLE + "$")),
+    ("row_count", re.compile(r"^how many (?P<table>[\w-]+) (?:are there|do (?:we|i) have|exist)$")),
+    ("first_rows", re.compile(r"^(?:show|list|display|give me|get|fetch)(?: me)?(?: the)?(?: (?:first|top))? ?(?P<n>\d+)? (?:rows|records|entries) (?:of|from|in) " + _TABLE + "$")),
+    ("first_rows", re.compile(r"^(?:preview|peek at|sample) " + _TABLE + "$")),
+    ("first_rows", re.compile(r"^(?:show|display)(?: me)? (?:the )?(?P<table>[\w.-]+) table$")),
+]
+
+_stats_lock = threading.Lock()
+_stats = {"questions": 0, "hits": 0, "failed": 0, "intents": {}}
+
+
+class Intent:
+    """A structural question recognised without the LLM, with the SQL that answers it."""
+
+    def __init__(self, name: str, sql: str, table: Optional[str] = None, rows: Optional[int] = None):
+        self.name = name
+        self.sql = sql
+        self.table = table
+        self.rows = rows
+
+
+def normalize(question: str) -> str:
+    question = re.sub(r"[?!.;:,]+\s*$", "", question.strip().lower())
+    question = re.sub(r"^(?:please|can you|could you|would you)\s+", "", question)
+    question = re.sub(r"\s+please$", "", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def resolve_table(tables: List[str], name: str) -> Optional[str]:
+    """Match a name from the question to a table: exact, case-insensitive, then singular/plural folded."""
+    if name in tables:
+        return name
+    lowered = {t.lower(): t for t in tables}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    folded = {"_".join(tokenize(t)): t for t in tables}
+    return folded.get("_".join(tokenize(name)))
+
+
+def _sql(name: str, tables: List[str], table: Optional[str], rows: Optional[int]) -> str:
+    user_tables = "m.type = 'table' AND m.name NOT LIKE 'sqlite_%'"
+    if name == "list_tables":
+        return ("SELECT m.name AS table_name, (SELECT count(*) FROM pragma_table_info(m.name)) AS column_count "
+                f"FROM sqlite_master m WHERE {user_tables} ORDER BY m.name")
+    if name == "schema":
+        return ("SELECT m.name AS table_name, p.name AS column_name, p.type AS column_type, p.pk AS primary_key "
+                f"FROM sqlite_master m JOIN pragma_table_info(m.name) p WHERE {user_tables} ORDER BY m.name, p.cid")
+    if name == "table_schema":
+        return ("SELECT name AS column_name, type AS column_type, pk AS primary_key, \"notnull\" AS not_null "
+                f"FROM pragma_table_info({_literal(table)}) ORDER BY cid")
+    if name == "row_counts":
+        return " UNION ALL ".join(f"SELECT {_literal(t)} AS table_name, count(*) AS row_count FROM {_ident(t)}"
+                                  for t in tables)
+    if name == "row_count":
+        return f"SELECT count(*) AS row_count FROM {_ident(table)}"
+    return f"SELECT * FROM {_ident(table)} LIMIT {rows}"
+
+
+def route_question(catalog, question: str) -> Optional[Intent]:
+    """
+    Recognise schema, table-list, row-count and preview questions and build
+    their SQL from a fixed template, so they are answered without the LLM.
+    Questions naming a table that doesn't exist are left to the LLM.
+    """
+    text = normalize(question)
+    match, name = None, None
+    for intent, pattern in PATTERNS:
+        match = pattern.match(text)
+        if match:
+            name = intent
+            break
+
+    table, rows = None, None
+    if match is not None and "table" in match.groupdict():
+        table = resolve_table(catalog.tables, match.group("table"))
+        if table is None:
+            match = None
+    if match is not None and name == "row_counts" and not catalog.tables:
+        match = None
+    if match is not None and name == "first_rows":
+        rows = min(int(match.groupdict().get("n") or DEFAULT_PREVIEW_ROWS), MAX_PREVIEW_ROWS)
+
+    with _stats_lock:
+        _stats["questions"] += 1
+        if match is not None:
+            _stats["hits"] += 1
+            _stats["intents"][name] = _stats["intents"].get(name, 0) + 1
+    if match is None:
+        return None
+    return Intent(name, _sql(name, catalog.tables, table, rows), table, rows)
+
+
+def record_intent_failure() -> None:
+    """The template SQL failed to run; the question went to the LLM after all."""
+    with _stats_lock:
+        _stats["failed"] += 1
+
+
+def explain_intent(step: Dict, result: Dict) -> str:
+    """Answer text for a routed question, written from the result instead of by the LLM."""
+    name, table = step.get("intent"), step.get("table")
+    data = result.get("data", [])
+    if name == "list_tables":
+        names = [row["table_name"] for row in data]
+        shown = ", ".join(names[:30]) + (f" and {len(names) - 30} more" if len(names) > 30 else "")
+        return f"The database has {len(names)} table(s): {shown}."
+    if name == "schema":
+        tables = {row["table_name"] for row in data}
+        return f"The database has {len(tables)} table(s) with {len(data)} column(s) in total; each column is listed with its type."
+    if name == "table_schema":
+        columns = ", ".join(f"{row['column_name']} ({row['column_type'] or 'any'})" for row in data)
+        return f"Table {table} has {len(data)} column(s): {columns}."
+    if name == "row_counts":
+        counts = ", ".join(f"{row['table_name']}: {row['row_count']}" for row in data[:30])
+        return f"Row counts per table: {counts}."
+    if name == "row_count":
+        return f"Table {table} has {data[0]['row_count'] if data else 0} row(s)."
+    return f"Here are the first {len(data)} row(s) of {table}."
+
+
+def intent_stats() -> Dict:
+    with _stats_lock:
+        stats = {**_stats, "intents": dict(_stats["intents"])}
+    stats["hit_rate"] = stats["hits"] / stats["questions"] if stats["questions"] else 0.0
+    return stats
@@ -0,0 +1,73 @@
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import ConnectionFailure
+from pymongo.server_api import ServerApi
+from app.config import Config
+
+# Indexes every lookup in the app relies on: (collection, keys, options)
+INDEXES = [
+    ("projects", [("chat_id", ASCENDING)], {}),
+    ("projects", [("user_id", ASCENDING)], {}),
+    ("chats", [("chat_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], {}),
+    ("chats", [("visualizationId", ASCENDING)], {"sparse": True}),
+    ("users", [("email", ASCENDING)], {}),
+    ("project_samples", [("chat_id", ASCENDING), ("table_name", ASCENDING)], {}),
+]
+
+
+def _client_options() -> dict:
+    return {
+        "server_api": ServerApi("1"),
+        "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": Config.MONGO_MAX_IDLE_MS,
+        "waitQueueTimeoutMS": Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+
+
+if not Config.MONGO_URI:
+    raise RuntimeError("MONGO_URI is not set; put the connection string in the environment or backend/.env")
+
+# The one pymongo client of this process (Flask blueprints, scripts, write-behind flushes). connect=False
+# defers the pool and its monitor threads until the first operation, so processes
+# that only use the async client below never open it.
+client = MongoClient(Config.MONGO_URI, connect=False, **_client_options())
+db = client[Config.MONGO_DB_NAME]
+
+_async_client = None
+
+
+def get_async_db():
+    """The Motor database handle for the FastAPI app, created on first use with the same pool settings."""
+    global _async_client
+    if _async_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        _async_client = AsyncIOMotorClient(Config.MONGO_URI, **_client_options())
+    return _async_client[Config.MONGO_DB_NAME]
+
+
+def ensure_indexes() -> None:
+    """Create the indexes in INDEXES if missing (a no-op when they exist). Failures are logged, not raised."""
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except ConnectionFailure as e:
+            # Server unreachable: don't wait out the selection timeout once per index
+            print("Could not create MongoDB indexes:", e)
+            return
+        except Exception as e:
+            print(f"Could not create index {keys} on {collection}:", e)
+
+
+async def ensure_indexes_async() -> None:
+    """ensure_indexes for the Motor client, run at FastAPI startup."""
+    async_db = get_async_db()
+    for collection, keys, options in INDEXES:
+        try:
+            await async_db[collection].create_index(keys, **options)
+        except ConnectionFailure as e:
+            # Server unreachable: don't wait out the selection timeout once per index
+            print("Could not create MongoDB indexes:", e)
+            return
+        except Exception as e:
+            print(f"Could not create index {keys} on {collection}:", e)
@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+from app.config import Config
+
+# Words that don't change what a question asks for
+STOP_WORDS = {
+    "a", "an", "the", "me", "my", "please", "show", "give", "list", "display", "get", "find",
+    "what", "which", "is", "are", "was", "were", "of", "for", "in", "on", "all", "can", "you",
+    "i", "want", "to", "see", "tell", "about", "do", "does", "there", "some",
+}
+
+
+def normalize_question(question: str) -> str:
+    question = question.lower()
+    question = re.sub(r"[^\w\s.%'-]", " ", question)
+    return re.sub(r"\s+", " ", question).strip().rstrip(".")
+
+
+def _singular(token: str) -> str:
+    if not token.isalpha():
+        return token
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def question_tokens(normalized: str) -> FrozenSet[str]:
+    """The content words of a question, plurals folded; word order and stop words don't count."""
+    return frozenset(_singular(t) for t in re.findall(r"[\w.%'-]+", normalized) if t not in STOP_WORDS)
+
+
+class _Entry:
+    def __init__(self, sql: str, tokens: FrozenSet[str]):
+        self.sql = sql
+        self.tokens = tokens
+
+
+# (project, signature, history) -> OrderedDict[normalized question -> entry]
+_buckets: Dict[Tuple[str, Tuple, str], "OrderedDict[str, _Entry]"] = {}
+# LRU order across all buckets, used for global eviction
+_lru: "OrderedDict[Tuple, None]" = OrderedDict()
+_signatures: Dict[str, Tuple] = {}
+_lock = threading.Lock()
+_stats = {"exact_hits": 0, "fuzzy_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+
+def _project_key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+
+def _check_signature(project: str, signature: Tuple) -> None:
+    """Drop every entry for a project whose database file changed."""
+    previous = _signatures.get(project)
+    if previous is not None and previous != signature:
+        _drop_project(project)
+        _stats["invalidations"] += 1
+    _signatures[project] = signature
+
+
+def _drop_project(project: str) -> None:
+    for bucket_key in [k for k in _buckets if k[0] == project]:
+        for question in _buckets.pop(bucket_key):
+            _lru.pop((bucket_key, question), None)
+
+
+def lookup_sql(db_path: str, signature: Tuple, question: str, history: str = "") -> Optional[Dict]:
+    """
+    Return {"sql": ..., "match": "exact"|"fuzzy", "question": ...} for a
+    previously answered question on the same database version, or None on a miss.
+    A fuzzy match has exactly the same content words ("total sales by region"
+    and "show sales total by regions"); one different word, be it an aggregate,
+    a column or a negation, is a different question.
+    """
+    if not Config.QUERY_CACHE_ENABLED:
+        return None
+    project = _project_key(db_path)
+    normalized = normalize_question(question)
+    bucket_key = (project, signature, history)
+
+    with _lock:
+        _check_signature(project, signature)
+        bucket = _buckets.get(bucket_key)
+        if bucket:
+            entry = bucket.get(normalized)
+            if entry is not None:
+                _lru.move_to_end((bucket_key, normalized))
+                _stats["exact_hits"] += 1
+                return {"sql": entry.sql, "match": "exact", "question": normalized}
+
+            tokens = question_tokens(normalized)
+            for cached_question, candidate in bucket.items():
+                if candidate.tokens == tokens:
+                    _lru.move_to_end((bucket_key, cached_question))
+                    _stats["fuzzy_hits"] += 1
+                    return {"sql": candidate.sql, "match": "fuzzy", "question": cached_question}
+
+        _stats["misses"] += 1
+        return None
+
+
+def store_sql(db_path: str, signature: Tuple, question: str, sql: str, history: str = "") -> None:
+    """Remember SQL that executed successfully for a question."""
+    if not Config.QUERY_CACHE_ENABLED:
+        return
+    project = _project_key(db_path)
+    normalized = normalize_question(question)
+    bucket_key = (project, signature, history)
+
+    with _lock:
+        _check_signature(project, signature)
+        bucket = _buckets.setdefault(bucket_key, OrderedDict())
+        bucket[normalized] = _Entry(sql, question_tokens(normalized))
+        _lru[(bucket_key, normalized)] = None
+        _lru.move_to_end((bucket_key, normalized))
+        _stats["stores"] += 1
+
+        while len(_lru) > Config.QUERY_CACHE_MAX_ENTRIES:
+            (old_bucket_key, old_question), _ = _lru.popitem(last=False)
+            old_bucket = _buckets.get(old_bucket_key)
+            if old_bucket is not None:
+                old_bucket.pop(old_question, None)
+                if not old_bucket:
+                    del _buckets[old_bucket_key]
+
+
+def forget_sql(db_path: str, signature: Tuple, cached_question: str, history: str = "") -> None:
+    """Drop a cached answer (as returned by lookup_sql) that turned out not to work."""
+    bucket_key = (_project_key(db_path), signature, history)
+    with _lock:
+        bucket = _buckets.get(bucket_key)
+        if bucket is not None:
+            bucket.pop(cached_question, None)
+        _lru.pop((bucket_key, cached_question), None)
+
+
+def invalidate_project(db_path: str) -> None:
+    with _lock:
+        _drop_project(_project_key(db_path))
+        _signatures.pop(_project_key(db_path), None)
+
+
+def query_cache_stats() -> Dict:
+    with _lock:
+        lookups = _stats["exact_hits"] + _stats["fuzzy_hits"] + _stats["misses"]
+        hits = _stats["exact_hits"] + _stats["fuzzy_hits"]
+        return {**_stats, "entries": len(_lru), "hit_rate": (hits / lookups) if lookups else 0.0}
@@ -0,0 +1,138 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from app.config import Config
+from app.functions.concurrency import run_db
+
+
+class QueryAborted(Exception):
+    """
+    A generated query was stopped by the execution guard. The message is
+    written for the LLM retry loop, so it says how to make the query cheaper.
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+_stats_lock = threading.Lock()
+_stats = {"guarded": 0, "timeout": 0, "scan_limit": 0, "row_limit": 0, "cancelled": 0}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def row_limit_error(max_rows: int) -> QueryAborted:
+    _count("row_limit")
+    return QueryAborted(
+        "row_limit",
+        f"Query returned more than {max_rows} rows. Aggregate the data or add a LIMIT instead of listing every row."
+    )
+
+
+class ExecutionGuard:
+    """
+    Deadline, scan budget and cancel switch for one query execution.
+
+    Installed as the connection's SQLite progress handler, which runs every
+    QUERY_PROGRESS_INTERVAL virtual-machine instructions and aborts the
+    statement by returning non-zero. cancel() can be called from any thread
+    (e.g. when the HTTP client goes away) and also interrupts the connection
+    directly so a long sort or join stops at its next instruction.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, max_steps: Optional[int] = None, max_rows: Optional[int] = None):
+        self.timeout = Config.QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+        self.max_steps = Config.QUERY_MAX_VM_STEPS if max_steps is None else max_steps
+        self.max_rows = Config.QUERY_MAX_ROWS if max_rows is None else max_rows
+        self.interval = max(1, Config.QUERY_PROGRESS_INTERVAL)
+        self.cancelled = threading.Event()
+        self.reason: Optional[str] = None
+        self._deadline = 0.0
+        self._steps = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _check(self) -> int:
+        self._steps += self.interval
+        if self.cancelled.is_set():
+            self.reason = self.reason or "cancelled"
+        elif self.timeout and time.monotonic() > self._deadline:
+            self.reason = "timeout"
+        elif self.max_steps and self._steps > self.max_steps:
+            self.reason = "scan_limit"
+        else:
+            return 0
+        return 1
+
+    def cancel(self) -> None:
+        self.reason = self.reason or "cancelled"
+        self.cancelled.set()
+        conn = self._conn
+        if conn is not None:
+            conn.interrupt()
+
+    def _error(self) -> QueryAborted:
+        reason = self.reason or "cancelled"
+        _count(reason)
+        if reason == "timeout":
+            message = (f"Query exceeded the {self.timeout:g}s time limit. Write a cheaper query: "
+                       "filter early, avoid cross joins and correlated subqueries, and aggregate instead of listing rows.")
+        elif reason == "scan_limit":
+            message = ("Query scanned too much data. Write a cheaper query: "
+                       "join on keys, filter before joining and avoid cross joins.")
+        else:
+            message = "Query was cancelled."
+        return QueryAborted(reason, message)
+
+    @contextmanager
+    def attach(self, conn: sqlite3.Connection):
+        """Guard every statement run on `conn` inside the block; each attach starts a fresh budget."""
+        if self.cancelled.is_set():
+            raise self._error()
+        self._deadline = time.monotonic() + (self.timeout or 0)
+        self._steps = 0
+        self._conn = conn
+        conn.set_progress_handler(self._check, self.interval)
+        _count("guarded")
+        try:
+            yield self
+        except sqlite3.OperationalError as e:
+            if self.reason is not None or "interrupted" in str(e):
+                raise self._error() from e
+            raise
+        finally:
+            # Pooled connections are shared; never leave our handler behind
+            conn.set_progress_handler(None, 0)
+            self._conn = None
+
+
+@contextmanager
+def guarded(conn: sqlite3.Connection, guard: Optional[ExecutionGuard] = None):
+    """Shorthand for (guard or ExecutionGuard()).attach(conn)."""
+    with (guard or ExecutionGuard()).attach(conn) as active:
+        yield active
+
+
+async def run_guarded(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    run_db for guarded calls: `fn` gets a fresh ExecutionGuard as guard=...,
+    and if the awaiting task is cancelled (client disconnected, request
+    aborted) the statement running on the DB thread is interrupted too.
+    """
+    guard = ExecutionGuard()
+    try:
+        return await run_db(fn, *args, guard=guard, **kwargs)
+    except asyncio.CancelledError:
+        guard.cancel()
+        raise
+
+
+def guard_stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,182 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from app.functions.query_guard import row_limit_error
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; everything else works on NumPy alone
+    pa = None
+
+
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
+def wants_arrow(accept: Optional[str]) -> bool:
+    """True when an Accept header asks for the Arrow IPC stream format."""
+    return bool(accept) and ARROW_STREAM_MIME in accept
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _to_array(values) -> np.ndarray:
+    """
+    One column as a NumPy array. All-int / all-float columns without NULLs get
+    a native dtype (8 bytes per value); anything else (text, NULLs, blobs)
+    stays an object array so values round-trip unchanged.
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    values = list(values)
+    if values and type(values[0]) in (int, float):
+        try:
+            # NumPy's own inference is C-speed; only keep it if it landed on int64/float64
+            column = np.array(values)
+            if column.dtype in (np.int64, np.float64):
+                return column
+        except (OverflowError, ValueError):
+            pass
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class QueryResult:
+    """
+    Column-oriented SQL result: one NumPy array per column instead of one
+    dict per row, so column names are stored once and numeric columns are
+    packed. Converts to records, a DataFrame or an Arrow table on demand.
+    """
+
+    def __init__(self, columns: List[str], column_data: List[Sequence[Any]]):
+        self.columns = list(columns)
+        self.column_data = [_to_array(values) for values in column_data]
+
+    @classmethod
+    def from_cursor(cls, cursor, batch_size: int = 10000, max_rows: int = 0) -> "QueryResult":
+        """Drain a cursor in batches; more than `max_rows` rows (when set) raises QueryAborted."""
+        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        chunks: List[List[np.ndarray]] = [[] for _ in columns]
+        fetched = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            fetched += len(rows)
+            if max_rows and fetched > max_rows:
+                raise row_limit_error(max_rows)
+            for chunk, values in zip(chunks, zip(*rows)):
+                chunk.append(_to_array(values))
+        return cls(columns, [cls._concat(chunk) for chunk in chunks])
+
+    @staticmethod
+    def _concat(chunk: List[np.ndarray]) -> np.ndarray:
+        if not chunk:
+            return np.empty(0, dtype=object)
+        if len(chunk) == 1:
+            return chunk[0]
+        if len({c.dtype for c in chunk}) == 1:
+            return np.concatenate(chunk)
+        # int batch followed by a float/NULL batch etc.: fall back to object
+        return _to_array([v for c in chunk for v in c.tolist()])
+
+    @classmethod
+    def from_rows(cls, columns: List[str], rows: Sequence[Sequence[Any]]) -> "QueryResult":
+        column_data = list(zip(*rows)) if rows else [[] for _ in columns]
+        return cls(columns, column_data)
+
+    @classmethod
+    def from_records(cls, columns: List[str], records: Sequence[Dict[str, Any]]) -> "QueryResult":
+        return cls(columns, [[record.get(col) for record in records] for col in columns])
+
+    @classmethod
+    def from_dataframe(cls, df) -> "QueryResult":
+        return cls([str(col) for col in df.columns], [df[col].to_numpy() for col in df.columns])
+
+    @property
+    def row_count(self) -> int:
+        return len(self.column_data[0]) if self.column_data else 0
+
+    def slice(self, start: int, stop: int) -> "QueryResult":
+        """Rows [start, stop) as a new result sharing this one's arrays."""
+        result = QueryResult.__new__(QueryResult)
+        result.columns = self.columns
+        result.column_data = [values[start:stop] for values in self.column_data]
+        return result
+
+    def freeze(self) -> "QueryResult":
+        """Make the column arrays read-only in place (done before a result is shared); returns self."""
+        for values in self.column_data:
+            values.flags.writeable = False
+        return self
+
+    def read_only_view(self) -> "QueryResult":
+        """A new result over this one's arrays that can't write to them, with its own column list."""
+        result = QueryResult.__new__(QueryResult)
+        result.columns = list(self.columns)
+        result.column_data = []
+        for values in self.column_data:
+            view = values.view()
+            view.flags.writeable = False
+            result.column_data.append(view)
+        return result
+
+    def rows(self) -> List[tuple]:
+        return list(zip(*[values.tolist() for values in self.column_data]))
+
+    def records(self) -> List[Dict[str, Any]]:
+        # tolist() turns NumPy scalars back into plain Python values for JSON/BSON
+        return [dict(zip(self.columns, row)) for row in zip(*[values.tolist() for values in self.column_data])]
+
+    def to_dataframe(self):
+        import pandas as pd
+        # Positional construction keeps duplicate column names (e.g. two "id" columns from a join)
+        if not self.column_data:
+            return pd.DataFrame(columns=self.columns)
+        # Shared (read-only) arrays are copied so edits to the frame stay local to it
+        shared = any(not values.flags.writeable for values in self.column_data)
+        df = pd.DataFrame(dict(enumerate(self.column_data)), copy=shared)
+        df.columns = self.columns
+        return df
+
+    def to_arrow(self):
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed")
+        arrays = []
+        for values in self.column_data:
+            if values.dtype != object:
+                arrays.append(pa.array(values))
+                continue
+            try:
+                arrays.append(pa.array(values, from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # SQLite allows mixed types in one column; ship those as text
+                arrays.append(pa.array([None if v is None else str(v) for v in values.tolist()], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+    def to_arrow_ipc(self, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+        """
+        Serialize as an Arrow IPC stream. `metadata` (JSON-encoded under the
+        "query" key of the schema metadata) carries non-tabular response fields.
+        """
+        table = self.to_arrow()
+        if metadata:
+            table = table.replace_schema_metadata({"query": json.dumps(metadata, default=str)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def estimated_size(self) -> int:
+        size = 64 + sum(len(c) for c in self.columns)
+        for values in self.column_data:
+            size += values.nbytes
+            if values.dtype == object:
+                for value in values:
+                    if isinstance(value, (str, bytes)):
+                        size += 49 + len(value)
+                    else:
+                        size += 24
+        return size
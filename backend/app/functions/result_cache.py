@@ -0,0 +1,179 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.config import Config
+from app.functions.db_pool import pooled_connection
+from app.functions.query_result import QueryResult
+from app.functions.query_guard import ExecutionGuard
+from app.functions.sql_text import CODE, COMMENT, scan_sql
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Normalize SQL text so trivially different spellings of the same query
+    share a cache entry: comments, trailing semicolons and runs of whitespace
+    outside string literals and quoted identifiers are ignored. Case is kept,
+    since an alias spelled differently labels the result columns differently.
+    """
+    parts, code = [], []
+    for kind, text in scan_sql(sql):
+        if kind in (CODE, COMMENT):
+            code.append(" " if kind == COMMENT else text)
+            continue
+        parts.append(re.sub(r"\s+", " ", "".join(code)))
+        parts.append(text)
+        code = []
+    parts.append(re.sub(r"\s+", " ", "".join(code)).rstrip().rstrip(";").rstrip())
+    return "".join(parts).strip()
+
+
+def _file_signature(db_path: str) -> Tuple[int, int]:
+    st = os.stat(db_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+_entries: "OrderedDict[Tuple, Tuple[QueryResult, int]]" = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "spill_hits": 0, "misses": 0, "evictions": 0, "spills": 0, "uncacheable": 0}
+
+
+def _spill_path(key: Tuple) -> str:
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(Config.RESULT_CACHE_SPILL_DIR, f"{digest}.pkl")
+
+
+def _spill(evicted: List[Tuple[Tuple, QueryResult]]) -> None:
+    # Called without _lock held: pickling and disk writes must not stall cache lookups
+    if not Config.RESULT_CACHE_SPILL_DIR or not evicted:
+        return
+    try:
+        os.makedirs(Config.RESULT_CACHE_SPILL_DIR, exist_ok=True)
+        for key, result in evicted:
+            with open(_spill_path(key), "wb") as f:
+                pickle.dump((result.columns, result.column_data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            with _lock:
+                _stats["spills"] += 1
+        _trim_spill_dir()
+    except OSError as e:
+        print("Result cache spill failed:", e)
+
+
+def _trim_spill_dir() -> None:
+    files = []
+    for name in os.listdir(Config.RESULT_CACHE_SPILL_DIR):
+        path = os.path.join(Config.RESULT_CACHE_SPILL_DIR, name)
+        st = os.stat(path)
+        files.append((st.st_atime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= Config.RESULT_CACHE_SPILL_MAX_BYTES:
+            break
+        os.remove(path)
+        total -= size
+
+
+def _load_spilled(key: Tuple) -> Optional[QueryResult]:
+    if not Config.RESULT_CACHE_SPILL_DIR:
+        return None
+    try:
+        with open(_spill_path(key), "rb") as f:
+            columns, column_data = pickle.load(f)
+        return QueryResult(columns, column_data)
+    except (OSError, pickle.PickleError, EOFError):
+        return None
+
+
+def _insert(key: Tuple, result: QueryResult, size: int) -> List[Tuple[Tuple, QueryResult]]:
+    """Add an entry (with _lock held); returns the evicted entries for _spill once the lock is released."""
+    global _total_bytes
+    evicted = []
+    previous = _entries.pop(key, None)
+    if previous is not None:
+        _total_bytes -= previous[1]
+    _entries[key] = (result, size)
+    _total_bytes += size
+    # Size-aware LRU: evict the least recently used results until under budget
+    while _total_bytes > Config.RESULT_CACHE_MAX_BYTES and len(_entries) > 1:
+        old_key, (old_result, old_size) = _entries.popitem(last=False)
+        _total_bytes -= old_size
+        _stats["evictions"] += 1
+        evicted.append((old_key, old_result))
+    return evicted
+
+
+def _cache_key(db_path: str, sql: str) -> Tuple:
+    return (os.path.abspath(db_path), _file_signature(db_path), canonicalize_sql(sql))
+
+
+def get_cached_result(db_path: str, sql: str) -> Optional[QueryResult]:
+    """A cached result as a read-only view, so one caller can't change what the others see."""
+    key = _cache_key(db_path, sql)
+    with _lock:
+        cached = _entries.get(key)
+        if cached is not None:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return cached[0].read_only_view()
+    spilled = _load_spilled(key)
+    evicted = []
+    with _lock:
+        if spilled is None:
+            _stats["misses"] += 1
+        else:
+            _stats["spill_hits"] += 1
+            evicted = _insert(key, spilled.freeze(), spilled.estimated_size())
+    _spill(evicted)
+    return spilled.read_only_view() if spilled is not None else None
+
+
+def put_cached_result(db_path: str, sql: str, result: QueryResult) -> None:
+    """Cache a complete result that was produced outside run_cached_query. Its arrays become read-only."""
+    key = _cache_key(db_path, sql)
+    size = result.estimated_size()
+    evicted = []
+    with _lock:
+        if size <= Config.RESULT_CACHE_MAX_ENTRY_BYTES:
+            evicted = _insert(key, result.freeze(), size)
+        else:
+            _stats["uncacheable"] += 1
+    _spill(evicted)
+
+
+def run_cached_query(db_path: str, sql: str, guard: Optional[ExecutionGuard] = None) -> QueryResult:
+    """
+    Execute a read-only query against a project database, serving repeated
+    queries on an unchanged file from the shared result cache. Execution is
+    bounded by the query guard (deadline, scan budget, QUERY_MAX_ROWS).
+    """
+    cached = get_cached_result(db_path, sql)
+    if cached is not None:
+        return cached
+
+    guard = guard or ExecutionGuard()
+    with pooled_connection(db_path) as conn, guard.attach(conn):
+        cursor = conn.execute(sql)
+        result = QueryResult.from_cursor(cursor, max_rows=guard.max_rows)
+
+    put_cached_result(db_path, sql, result)
+    return result.read_only_view()
+
+
+def invalidate_results(db_path: Optional[str] = None) -> None:
+    global _total_bytes
+    with _lock:
+        if db_path is None:
+            _entries.clear()
+            _total_bytes = 0
+            return
+        path = os.path.abspath(db_path)
+        for key in [k for k in _entries if k[0] == path]:
+            _total_bytes -= _entries.pop(key)[1]
+
+
+def result_cache_stats() -> Dict:
+    with _lock:
+        return {**_stats, "entries": len(_entries), "bytes": _total_bytes}
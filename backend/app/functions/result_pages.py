@@ -0,0 +1,220 @@
+import base64
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.config import Config
+from app.functions.db_pool import open_readonly
+from app.functions.query_result import QueryResult
+from app.functions.query_guard import ExecutionGuard
+from app.functions.result_cache import get_cached_result, put_cached_result
+from app.functions.sql_text import strip_comments
+
+
+class CursorExpired(Exception):
+    """The page token refers to a result set that was closed or never existed."""
+
+
+class ResultSet:
+    """
+    A query result that is read one page at a time.
+
+    Backed either by a held SQLite statement on its own read-only connection
+    (rows are pulled with fetchmany as pages are requested) or, when the
+    result is already complete in memory, by a QueryResult. The query runs
+    once: until its last row has been read, total_rows is a lower bound
+    (rows read so far plus one read ahead) and total_exact is False.
+    """
+
+    def __init__(self, db_path: str, sql: str):
+        self.id = secrets.token_urlsafe(12)
+        self.db_path = db_path
+        self.sql = sql
+        self.columns: List[str] = []
+        self.position = 0
+        self.total_rows: Optional[int] = None
+        self.total_exact = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self._conn = None
+        self._cursor = None
+        self._lookahead: List[tuple] = []
+        self._drained = False
+        self._materialized: Optional[QueryResult] = None
+
+    def open(self, guard: ExecutionGuard) -> None:
+        cached = get_cached_result(self.db_path, self.sql)
+        if cached is not None:
+            self._materialized = cached
+            self.columns = list(cached.columns)
+            self.total_rows, self.total_exact = cached.row_count, True
+            return
+
+        self._conn = open_readonly(self.db_path)
+        try:
+            with guard.attach(self._conn):
+                self._cursor = self._conn.execute(strip_comments(self.sql).strip().rstrip(";"))
+        except Exception:
+            self.close()
+            raise
+        self.columns = [desc[0] for desc in self._cursor.description] if self._cursor.description else []
+
+    def fetch(self, page_size: int, guard: ExecutionGuard) -> QueryResult:
+        self.last_used = time.monotonic()
+        if guard.max_rows:
+            # Never hand out more than QUERY_MAX_ROWS rows in total, however many pages are read
+            page_size = max(0, min(page_size, guard.max_rows - self.position))
+        if self._materialized is not None:
+            page = self._materialized.slice(self.position, self.position + page_size)
+        else:
+            # One row past the page tells whether another page exists, without counting the result
+            with guard.attach(self._conn):
+                rows = self._lookahead + self._cursor.fetchmany(page_size + 1 - len(self._lookahead))
+            self._lookahead = rows[page_size:]
+            self._drained = not self._lookahead
+            page = QueryResult.from_rows(self.columns, rows[:page_size])
+        self.position += page.row_count
+        if self._materialized is None:
+            self.total_rows = self.position + len(self._lookahead)
+            self.total_exact = self._drained
+        return page
+
+    @property
+    def exhausted(self) -> bool:
+        return self.total_exact and self.position >= self.total_rows
+
+    def truncated(self, guard: ExecutionGuard) -> bool:
+        return bool(guard.max_rows) and self.position >= guard.max_rows and not self.exhausted
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._cursor = None
+        self._lookahead = []
+        self._materialized = None
+
+
+_result_sets: "OrderedDict[str, ResultSet]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _encode_token(result_set_id: str, offset: int) -> str:
+    raw = json.dumps({"h": result_set_id, "o": offset}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_token(token: str) -> Dict:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeDecodeError):
+        raise CursorExpired("Invalid cursor")
+    # Well-formed base64 JSON that we didn't write ("MQ" is 1) is just as invalid
+    if not isinstance(decoded, dict) or not isinstance(decoded.get("h"), str) \
+            or type(decoded.get("o")) is not int:
+        raise CursorExpired("Invalid cursor")
+    return decoded
+
+
+def _expire_old() -> None:
+    now = time.monotonic()
+    for result_set_id, result_set in list(_result_sets.items()):
+        if now - result_set.last_used > Config.RESULT_CURSOR_TTL or len(_result_sets) > Config.RESULT_MAX_OPEN_CURSORS:
+            _result_sets.pop(result_set_id)
+            # A page being read right now keeps its statement; it is released when garbage collected
+            if result_set.lock.acquire(blocking=False):
+                try:
+                    result_set.close()
+                finally:
+                    result_set.lock.release()
+
+
+def _page(result_set: ResultSet, page_size: int, columnar: bool, guard: ExecutionGuard) -> Dict:
+    page = result_set.fetch(page_size, guard)
+    truncated = result_set.truncated(guard)
+    done = page.row_count < page_size or result_set.exhausted or truncated
+    if done:
+        with _lock:
+            _result_sets.pop(result_set.id, None)
+        if result_set._materialized is None and not truncated and result_set.position <= Config.RESULT_PAGE_SIZE:
+            # The whole result fit in the first page; let the result cache keep it
+            put_cached_result(result_set.db_path, result_set.sql, page)
+        result_set.close()
+    return {
+        "columns": list(result_set.columns),
+        # columnar=True hands back the QueryResult itself (e.g. for Arrow output)
+        ("result" if columnar else "data"): page if columnar else page.records(),
+        "next_cursor": None if done else _encode_token(result_set.id, result_set.position),
+        "total_rows": result_set.total_rows,
+        "total_rows_exact": result_set.total_exact,
+        "truncated": truncated,
+    }
+
+
+def _clamp(page_size: Optional[int]) -> int:
+    return max(1, min(page_size or Config.RESULT_PAGE_SIZE, Config.RESULT_MAX_PAGE_SIZE))
+
+
+def open_result_set(db_path: str, sql: str, page_size: Optional[int] = None, columnar: bool = False,
+                    guard: Optional[ExecutionGuard] = None) -> Dict:
+    """
+    Run a query and return its first page plus a total-row estimate.
+    Later pages are fetched with fetch_page(next_cursor).
+    """
+    page_size = _clamp(page_size)
+    guard = guard or ExecutionGuard()
+    result_set = ResultSet(db_path, sql)
+    result_set.open(guard)
+    with _lock:
+        _expire_old()
+        _result_sets[result_set.id] = result_set
+    with result_set.lock:
+        return _page(result_set, page_size, columnar, guard)
+
+
+def open_materialized(result: QueryResult, sql: str, page_size: Optional[int] = None, columnar: bool = False,
+                      guard: Optional[ExecutionGuard] = None) -> Dict:
+    """Page through a result that is already in memory (e.g. one computed from a chat's session tables)."""
+    page_size = _clamp(page_size)
+    guard = guard or ExecutionGuard()
+    result_set = ResultSet("", sql)
+    result_set._materialized = result
+    result_set.columns = list(result.columns)
+    result_set.total_rows, result_set.total_exact = result.row_count, True
+    with _lock:
+        _expire_old()
+        _result_sets[result_set.id] = result_set
+    with result_set.lock:
+        return _page(result_set, page_size, columnar, guard)
+
+
+def fetch_page(cursor: str, page_size: Optional[int] = None, columnar: bool = False,
+               guard: Optional[ExecutionGuard] = None) -> Dict:
+    """Return the page a next_cursor token points to."""
+    page_size = _clamp(page_size)
+    guard = guard or ExecutionGuard()
+    token = _decode_token(cursor)
+    with _lock:
+        _expire_old()
+        result_set = _result_sets.get(token.get("h"))
+        if result_set is not None:
+            # Least recently read result sets are the first closed when too many are open
+            _result_sets.move_to_end(result_set.id)
+    if result_set is None:
+        raise CursorExpired("Cursor expired or not found; run the query again")
+    with result_set.lock:
+        if token.get("o") != result_set.position:
+            raise CursorExpired("Cursor was already consumed; pages must be read in order")
+        return _page(result_set, page_size, columnar, guard)
+
+
+def close_result_set(cursor: str) -> None:
+    token = _decode_token(cursor)
+    with _lock:
+        result_set = _result_sets.pop(token.get("h"), None)
+    if result_set is not None:
+        with result_set.lock:
+            result_set.close()
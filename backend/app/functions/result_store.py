@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+from app.config import Config
+from app.functions.query_result import QueryResult
+
+# Column names once, then one JSON array per column, zlib-compressed. For page-sized
+# results this came out smaller than a zstd Arrow IPC stream (schema and buffer
+# overhead) and needs nothing beyond the standard library.
+JSON_ZLIB = "json-zlib"
+COMPRESSION_LEVEL = 6
+
+_stats_lock = threading.Lock()
+_stats = {"inline": 0, "blobs": 0, "rows_stored": 0, "bytes_stored": 0, "failed": 0, "loads": 0, "missing": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+def encode_result(result: QueryResult) -> Tuple[bytes, str]:
+    """The result as one compressed columnar blob, and its format tag."""
+    payload = {"columns": result.columns, "data": [values.tolist() for values in result.column_data]}
+    return zlib.compress(json.dumps(payload, default=str).encode("utf-8"), COMPRESSION_LEVEL), JSON_ZLIB
+
+
+def decode_result(data: bytes, fmt: str) -> List[Dict[str, Any]]:
+    """Rows of a blob written by encode_result, as records."""
+    if fmt != JSON_ZLIB:
+        raise ValueError(f"Unknown result blob format: {fmt}")
+    payload = json.loads(zlib.decompress(data))
+    return QueryResult(payload["columns"], payload["data"]).records()
+
+
+def needs_blob(records: List[Dict[str, Any]]) -> bool:
+    return len(records) > Config.RESULT_INLINE_ROWS
+
+
+def table_fields(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The table fields of an assistant message at insert time. Up to
+    RESULT_INLINE_ROWS rows stay inline in tableData; a larger result gets
+    tableRowCount and a tablePreview of its first RESULT_INLINE_ROWS rows,
+    and upload_table_data adds the rest later.
+    """
+    fields = {"tableRowCount": len(records)}
+    if not needs_blob(records):
+        _count("inline")
+        return {**fields, "tableData": records}
+    return {**fields, "tablePreview": records[:Config.RESULT_INLINE_ROWS]}
+
+
+async def upload_table_data(async_db, columns: List[str], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Write a large result once to GridFS and return the fields to set on its
+    message: tableRef, or the rows inline in tableData if the blob can't be
+    written. Meant to run after the response has been sent.
+    """
+    try:
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        data, fmt = await asyncio.to_thread(encode_result, QueryResult.from_records(columns, records))
+        bucket = AsyncIOMotorGridFSBucket(async_db, bucket_name=Config.RESULT_STORE_BUCKET)
+        file_id = await bucket.upload_from_stream("result", data, metadata={"format": fmt, "rows": len(records)})
+    except Exception as e:
+        print("Could not store result blob, keeping rows inline:", e)
+        _count("failed")
+        return {"tableData": records}
+    with _stats_lock:
+        _stats["blobs"] += 1
+        _stats["rows_stored"] += len(records)
+        _stats["bytes_stored"] += len(data)
+    return {"tableRef": {"id": file_id, "format": fmt}}
+
+
+def load_table_data(db, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    All stored rows of a message: inline tableData, or its GridFS blob (the
+    preview while the blob is still being written, or if it is gone).
+    """
+    ref = message.get("tableRef")
+    if not ref:
+        return message.get("tableData") or message.get("tablePreview") or []
+    import gridfs
+    _count("loads")
+    try:
+        data = gridfs.GridFSBucket(db, bucket_name=Config.RESULT_STORE_BUCKET).open_download_stream(ref["id"]).read()
+    except gridfs.errors.NoFile:
+        _count("missing")
+        return message.get("tablePreview") or []
+    return decode_result(data, ref["format"])
+
+
+def result_store_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["bytes_per_row"] = stats["bytes_stored"] / stats["rows_stored"] if stats["rows_stored"] else 0.0
+    return stats
@@ -0,0 +1,49 @@
+from typing import Dict, List, Optional, Tuple
+import bson
+from app.config import Config
+from app.functions.mongo import db
+
+samples_collection = db.project_samples
+
+
+def _fit(doc: Dict) -> Dict:
+    # Halve the rows until the document fits; one table of wide rows must not hit the BSON limit
+    while doc["rows"] and len(bson.encode(doc)) > Config.SAMPLE_MAX_BYTES:
+        doc["rows"] = doc["rows"][:len(doc["rows"]) // 2]
+        doc["truncated"] = True
+    return doc
+
+
+def store_samples(chat_id: str, project_id, samples: Dict[str, Tuple[List[str], List[list]]]) -> None:
+    """
+    Store the sample rows of each table as one document per table, with the
+    column names once and every row as a plain array. Replaces the samples
+    of an earlier upload to the same chat.
+    """
+    docs = [_fit({"chat_id": chat_id, "project_id": project_id, "table_name": table,
+                  "columns": list(columns), "rows": [list(row) for row in rows], "truncated": False})
+            for table, (columns, rows) in samples.items()]
+    samples_collection.delete_many({"chat_id": chat_id})
+    if docs:
+        samples_collection.insert_many(docs)
+
+
+def as_records(columns: List[str], rows: List[list]) -> List[Dict]:
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def load_samples(chat_id: str, table: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """Sample rows per table as lists of records, optionally for one table and at most `limit` rows each."""
+    query = {"chat_id": chat_id}
+    if table:
+        query["table_name"] = table
+    projection = {"_id": 0, "table_name": 1, "columns": 1, "rows": 1 if not limit else {"$slice": limit}}
+    docs = list(samples_collection.find(query, projection))
+    if docs:
+        return {doc["table_name"]: as_records(doc["columns"], doc["rows"]) for doc in docs}
+
+    # Projects uploaded before samples moved out still carry them in database_details.data
+    field = f"database_details.data.{table}" if table else "database_details.data"
+    project = db.projects.find_one({"chat_id": chat_id}, {"_id": 0, field: 1}) or {}
+    data = project.get("database_details", {}).get("data", {})
+    return {name: records[:limit] if limit else records for name, records in data.items()}
@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from langchain_community.utilities import SQLDatabase
+from app.config import Config
+from app.functions.db_pool import get_engine, pooled_connection
+
+
+class CatalogEntry:
+    """
+    Everything the NL-to-SQL prompt needs to know about one database file.
+
+    Built once per (file_path, mtime, size) and shared by every request that
+    asks about the same project until the file changes on disk.
+    """
+
+    def __init__(self, db_path: str, signature: Tuple[int, int], db: SQLDatabase,
+                 tables: List[str], table_info: str, sample_data: Dict[str, List[Dict]],
+                 columns: Optional[Dict[str, List[str]]] = None, ddl: Optional[List[str]] = None,
+                 column_types: Optional[Dict[str, List[str]]] = None,
+                 foreign_keys: Optional[Dict[str, List[Tuple[str, str, str]]]] = None,
+                 table_ddl: Optional[Dict[str, str]] = None):
+        self.db_path = db_path
+        self.signature = signature
+        self.db = db
+        self.tables = tables
+        self.table_info = table_info
+        self.sample_data = sample_data
+        # Column names per table and the CREATE statements, for validating SQL without touching the file
+        self.columns = columns or {}
+        self.ddl = ddl or []
+        self.column_types = column_types or {}
+        # table -> [(column, referenced table, referenced column)]
+        self.foreign_keys = foreign_keys or {}
+        self.table_ddl = table_ddl or {}
+        self.size = len(table_info) + len(repr(sample_data)) + len(repr(self.columns)) + sum(len(d) for d in self.ddl)
+
+
+# Process-wide LRU of catalog entries keyed by the absolute db path
+_entries: "OrderedDict[str, CatalogEntry]" = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+
+def file_signature(db_path: str) -> Tuple[int, int]:
+    st = os.stat(db_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _build_entry(db_path: str, signature: Tuple[int, int]) -> CatalogEntry:
+    db = SQLDatabase(get_engine(db_path))
+
+    # Get schema and sample data
+    table_info_str = db.get_table_info()
+    sample_data = {}
+    tables = db.get_usable_table_names()
+    for tbl in tables:
+        try:
+            cursor = db.run(f'SELECT * FROM "{tbl}" LIMIT {Config.CATALOG_SAMPLE_ROWS};', fetch="cursor")
+            rows = cursor.mappings()
+            sample_data[tbl] = [dict(r) for r in rows]
+        except Exception:
+            sample_data[tbl] = []
+
+    with pooled_connection(db_path) as conn:
+        # Tables before the indexes/views/triggers that depend on them
+        master = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 WHEN 'view' THEN 2 ELSE 3 END"
+        ).fetchall()
+        ddl = [row[2] for row in master]
+        table_ddl = {row[1]: row[2] for row in master if row[0] in ("table", "view")}
+        columns, column_types, foreign_keys = {}, {}, {}
+        for tbl in tables:
+            info = conn.execute(f'PRAGMA table_info("{tbl}")').fetchall()
+            columns[tbl] = [row[1] for row in info]
+            column_types[tbl] = [row[2] or "" for row in info]
+            foreign_keys[tbl] = [(row[3], row[2], row[4]) for row in conn.execute(f'PRAGMA foreign_key_list("{tbl}")')]
+
+    return CatalogEntry(db_path, signature, db, list(tables), table_info_str, sample_data,
+                        columns, ddl, column_types, foreign_keys, table_ddl)
+
+
+def _drop(key: str) -> None:
+    global _total_bytes
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        _total_bytes -= entry.size
+
+
+def _evict_over_budget() -> None:
+    # Always keep the most recently used entry, even if it alone is over budget
+    while len(_entries) > 1 and (len(_entries) > Config.CATALOG_MAX_ENTRIES or _total_bytes > Config.CATALOG_MAX_BYTES):
+        key = next(iter(_entries))
+        _drop(key)
+        _stats["evictions"] += 1
+
+
+def get_catalog(db_path: str) -> CatalogEntry:
+    """
+    Return the cached catalog for a SQLite file, rebuilding it if the file
+    was modified (mtime or size changed) since it was last loaded.
+    """
+    global _total_bytes
+    key = os.path.abspath(db_path)
+    signature = file_signature(key)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry.signature == signature:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return entry
+            _drop(key)
+            _stats["invalidations"] += 1
+        _stats["misses"] += 1
+
+    # Build outside the lock so a slow database doesn't block other projects
+    entry = _build_entry(db_path, signature)
+
+    with _lock:
+        _drop(key)
+        _entries[key] = entry
+        _total_bytes += entry.size
+        _evict_over_budget()
+    return entry
+
+
+def invalidate(db_path: Optional[str] = None) -> None:
+    """Forget one database (or everything when no path is given)."""
+    global _total_bytes
+    with _lock:
+        if db_path is None:
+            _entries.clear()
+            _total_bytes = 0
+        else:
+            _drop(os.path.abspath(db_path))
+
+
+def catalog_stats() -> Dict:
+    with _lock:
+        return {**_stats, "entries": len(_entries), "bytes": _total_bytes}
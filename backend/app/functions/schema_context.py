@@ -0,0 +1,257 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from app.config import Config
+from app.functions.query_cache import STOP_WORDS
+
+# BM25 parameters and per-field weights (a field's tokens are repeated this many times)
+BM25_K1 = 1.2
+BM25_B = 0.75
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 2
+# Longest join path (in FK hops) added to connect two selected tables
+MAX_JOIN_HOPS = 3
+# Sample rows of wide tables only show this many columns (matched and key columns first)
+MAX_SAMPLE_COLUMNS = 12
+CHARS_PER_TOKEN = 4
+
+_stats_lock = threading.Lock()
+_stats = {"contexts": 0, "tables_total": 0, "tables_kept": 0, "tokens_full": 0, "tokens_pruned": 0}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with snake_case/camelCase split and plurals folded."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class _TableIndex:
+    """BM25 index with one document per table: name, columns, FK neighbours, comments and sampled values."""
+
+    def __init__(self, catalog):
+        self.tables = list(catalog.tables)
+        self.neighbours: Dict[str, set] = {t: set() for t in self.tables}
+        for table, fks in catalog.foreign_keys.items():
+            for _, ref_table, _ in fks:
+                if ref_table in self.neighbours and table in self.neighbours and ref_table != table:
+                    self.neighbours[table].add(ref_table)
+                    self.neighbours[ref_table].add(table)
+
+        self.docs: Dict[str, Counter] = {}
+        for table in self.tables:
+            tokens = tokenize(table) * TABLE_NAME_WEIGHT
+            for column in catalog.columns.get(table, []):
+                tokens += tokenize(column) * COLUMN_NAME_WEIGHT
+            for neighbour in self.neighbours[table]:
+                tokens += tokenize(neighbour)
+            ddl = catalog.table_ddl.get(table, "")
+            for comment in re.findall(r"--([^\n]*)|/\*(.*?)\*/", ddl, flags=re.DOTALL):
+                tokens += tokenize(" ".join(comment))
+            for row in catalog.sample_data.get(table, []):
+                for value in row.values():
+                    if isinstance(value, str) and len(value) <= 40:
+                        tokens += tokenize(value)
+            self.docs[table] = Counter(tokens)
+
+        self.avg_len = (sum(sum(d.values()) for d in self.docs.values()) / len(self.docs)) if self.docs else 0.0
+        df = Counter(token for doc in self.docs.values() for token in doc)
+        n = len(self.docs)
+        self.idf = {token: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for token, freq in df.items()}
+
+    def score(self, query_tokens: List[str]) -> Dict[str, float]:
+        scores = {}
+        for table, doc in self.docs.items():
+            length = sum(doc.values())
+            score = 0.0
+            for token in set(query_tokens):
+                tf = doc.get(token, 0)
+                if not tf:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_len or 1))
+                score += self.idf[token] * tf * (BM25_K1 + 1) / norm
+            scores[table] = score
+        return scores
+
+    def join_path(self, start: str, goal: str) -> List[str]:
+        """Shortest FK path between two tables (inclusive), or [] if none within MAX_JOIN_HOPS."""
+        previous = {start: None}
+        queue = deque([(start, 0)])
+        while queue:
+            table, hops = queue.popleft()
+            if table == goal:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path[::-1]
+            if hops == MAX_JOIN_HOPS:
+                continue
+            for neighbour in self.neighbours[table]:
+                if neighbour not in previous:
+                    previous[neighbour] = table
+                    queue.append((neighbour, hops + 1))
+        return []
+
+
+_indexes: "OrderedDict[Tuple[str, Tuple[int, int]], _TableIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _index_for(catalog) -> _TableIndex:
+    key = (os.path.abspath(catalog.db_path), catalog.signature)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = _TableIndex(catalog)
+    with _indexes_lock:
+        for stale in [k for k in _indexes if k[0] == key[0]]:
+            _indexes.pop(stale)
+        _indexes[key] = index
+        while len(_indexes) > Config.CATALOG_MAX_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _compact_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<blob {len(value)} bytes>"
+    if isinstance(value, str) and len(value) > Config.PROMPT_MAX_CELL_CHARS:
+        return value[:Config.PROMPT_MAX_CELL_CHARS] + f"...(+{len(value) - Config.PROMPT_MAX_CELL_CHARS} chars)"
+    return value
+
+
+class SchemaContext:
+    """The slice of a catalog that goes into one prompt, already rendered to text."""
+
+    def __init__(self, catalog, tables: List[str], scores: Dict[str, float], sample_rows: int,
+                 column_hits: Dict[str, List[str]]):
+        self.catalog = catalog
+        self.tables = tables
+        self.scores = scores
+        self.sample_rows = sample_rows
+        self.column_hits = column_hits
+
+    def _ddl(self, table: str) -> str:
+        ddl = self.catalog.table_ddl.get(table)
+        if not ddl:
+            cols = ", ".join(f"{c} {t}".strip() for c, t in zip(self.catalog.columns.get(table, []),
+                                                                 self.catalog.column_types.get(table, [])))
+            ddl = f'CREATE TABLE "{table}" ({cols})'
+        return re.sub(r"\s+", " ", ddl).strip()
+
+    def _sample_columns(self, table: str) -> List[str]:
+        columns = self.catalog.columns.get(table, [])
+        if len(columns) <= MAX_SAMPLE_COLUMNS:
+            return columns
+        keys = {fk[0] for fk in self.catalog.foreign_keys.get(table, [])}
+        preferred = [c for c in columns if c in self.column_hits.get(table, []) or c in keys or c.lower() == "id"]
+        rest = [c for c in columns if c not in preferred]
+        return (preferred + rest)[:MAX_SAMPLE_COLUMNS]
+
+    @property
+    def table_info(self) -> str:
+        return "\n\n".join(self._ddl(table) for table in self.tables)
+
+    @property
+    def sample_data(self) -> str:
+        if self.sample_rows <= 0:
+            return "(omitted)"
+        lines = []
+        for table in self.tables:
+            columns = self._sample_columns(table)
+            for row in self.catalog.sample_data.get(table, [])[:self.sample_rows]:
+                values = ", ".join(f"{col}={_compact_value(row.get(col))!r}" for col in columns)
+                lines.append(f"{table}: {values}")
+        return "\n".join(lines)
+
+    def outline(self) -> str:
+        """Column list with types, for prompts that don't need DDL."""
+        return "\n".join(
+            f"Table: {table}\n" + "\n".join(
+                f" - {col} ({typ})" for col, typ in zip(self.catalog.columns.get(table, []),
+                                                        self.catalog.column_types.get(table, []))
+            )
+            for table in self.tables
+        )
+
+    def prompt_text(self) -> str:
+        return f"{self.table_info}\n\nSample rows:\n{self.sample_data}"
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.table_info) + estimate_tokens(self.sample_data)
+
+
+def build_schema_context(catalog, question: Optional[str] = None, top_k: Optional[int] = None,
+                         token_budget: Optional[int] = None) -> SchemaContext:
+    """
+    Pick the tables a question needs and render them within a token budget.
+
+    Tables are ranked with BM25 against the question; the top_k matches are
+    kept together with the tables on the FK paths that join them. Without a
+    question (or when nothing matches) tables are taken in order of how
+    connected they are, as many as the budget allows. Over budget, sample
+    rows are reduced first, then the lowest-ranked tables are dropped.
+    """
+    top_k = top_k or Config.PROMPT_TOP_TABLES
+    token_budget = token_budget or Config.PROMPT_TOKEN_BUDGET
+    index = _index_for(catalog)
+    query_tokens = tokenize(question or "")
+    scores = index.score(query_tokens) if query_tokens else {t: 0.0 for t in index.tables}
+
+    matched = sorted((t for t in index.tables if scores[t] > 0), key=lambda t: -scores[t])
+    if matched:
+        selected = matched[:top_k]
+        for i, first in enumerate(list(selected)):
+            for second in selected[i + 1:]:
+                for table in index.join_path(first, second):
+                    if table not in selected:
+                        selected.append(table)
+    else:
+        selected = sorted(index.tables, key=lambda t: (-len(index.neighbours[t]), t))
+
+    token_set = set(query_tokens)
+    column_hits = {t: [c for c in catalog.columns.get(t, []) if token_set & set(tokenize(c))] for t in selected}
+
+    context = SchemaContext(catalog, selected, scores, Config.PROMPT_SAMPLE_ROWS, column_hits)
+    while context.tokens > token_budget:
+        if context.sample_rows > 0:
+            context.sample_rows -= 1
+        elif len(context.tables) > 1:
+            context.tables = context.tables[:-1]
+        else:
+            break
+
+    full_tokens = estimate_tokens(catalog.table_info) + estimate_tokens(repr(catalog.sample_data))
+    with _stats_lock:
+        _stats["contexts"] += 1
+        _stats["tables_total"] += len(index.tables)
+        _stats["tables_kept"] += len(context.tables)
+        _stats["tokens_full"] += full_tokens
+        _stats["tokens_pruned"] += context.tokens
+    return context
+
+
+def schema_context_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["token_reduction"] = 1 - stats["tokens_pruned"] / stats["tokens_full"] if stats["tokens_full"] else 0.0
+    return stats
@@ -0,0 +1,276 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from app.config import Config
+from app.functions.query_guard import ExecutionGuard, QueryAborted
+from app.functions.query_result import QueryResult
+from app.functions.result_cache import run_cached_query
+from app.functions.schema_context import tokenize
+from app.functions.sql_validator import validate_on_connection
+
+# A question is a follow-up only when it points back at the previous answer: an
+# explicit reference ("from these results", "the previous answer"; not "the rows
+# with ...", which asks for new ones), a leading
+# connective that can only continue ("now ...", "what about ..."), or a weaker
+# one ("only ...", "sort ...") together with a pronoun ("sort those by amount")
+EXPLICIT_REFERENCE_RE = re.compile(
+    r"\b(?:(?:these|those|previous|prior|above) (?:results?|answers?|rows|records|list|table|output)"
+    r"|(?:of|among|from|in|within) (?:these|those|them)|the above)\b",
+    re.IGNORECASE,
+)
+CONTINUATION_RE = re.compile(r"^\s*(?:now|instead|what about|how about|and what about|same (?:but|for)|break (?:it|that|them|those) down)\b",
+                             re.IGNORECASE)
+CONNECTIVE_RE = re.compile(r"^\s*(?:and|also|then|but|only|just|filter|sort|order|group|limit|exclude|remove|keep|split)\b",
+                           re.IGNORECASE)
+# Not "that"/"this": "only orders that shipped", "just this year's sales" are new questions
+PRONOUN_RE = re.compile(r"\b(?:those|these|them|it)\b", re.IGNORECASE)
+TABLE_PREFIX = "result_"
+
+_stats_lock = threading.Lock()
+_stats = {"stored": 0, "deferred": 0, "materialized": 0, "too_large": 0, "refinements": 0, "answered": 0,
+          "fallbacks": 0, "expired": 0}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def names_table(question: str, tables: List[str]) -> bool:
+    """Whether the question mentions one of the database's tables by name (plurals folded)."""
+    words = " " + " ".join(tokenize(question)) + " "
+    return any(f" {' '.join(tokenize(table))} " in words for table in tables if tokenize(table))
+
+
+def is_refinement(question: str, tables: List[str]) -> bool:
+    """
+    Whether `question` refers back to the previous answer rather than asking
+    something new. A question naming a database table goes to the database.
+    """
+    if names_table(question, tables):
+        return False
+    if EXPLICIT_REFERENCE_RE.search(question) or CONTINUATION_RE.search(question):
+        return True
+    return bool(CONNECTIVE_RE.search(question) and PRONOUN_RE.search(question))
+
+
+def _sql_type(values: np.ndarray) -> str:
+    if values.dtype.kind in "iub":
+        return "INTEGER"
+    if values.dtype.kind == "f":
+        return "REAL"
+    return ""
+
+
+def _column_names(columns: List[str]) -> List[str]:
+    # Joins can return the same name twice ("id", "id"); a table needs them unique
+    names, seen = [], {}
+    for column in columns:
+        name = str(column) or "column"
+        seen[name.lower()] = seen.get(name.lower(), 0) + 1
+        names.append(name if seen[name.lower()] == 1 else f"{name}_{seen[name.lower()]}")
+    return names
+
+
+class SessionResult:
+    def __init__(self, table: str, question: str, sql: str, columns: List[str], row_count: int, ddl: str,
+                 from_session: bool, source: Optional[str] = None):
+        self.table = table
+        self.question = question
+        self.sql = sql
+        self.columns = columns
+        self.row_count = row_count
+        self.ddl = ddl
+        # True when the SQL ran over earlier session tables rather than the project database
+        self.from_session = from_session
+        # Database the SQL still has to be run on before the table exists (see materialize)
+        self.source = source
+
+
+class ChatSession:
+    """
+    The last few results of one chat, kept as tables of a private in-memory
+    SQLite database so follow-up questions can be answered from them.
+    """
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.results: "OrderedDict[str, SessionResult]" = OrderedDict()
+        self.counter = 0
+        self.last_used = time.monotonic()
+
+    def _create_table(self, entry: SessionResult, result: QueryResult) -> None:
+        names = _column_names(result.columns)
+        column_defs = ", ".join(f'"{name}" {_sql_type(values)}'.rstrip()
+                                for name, values in zip(names, result.column_data))
+        ddl = f'CREATE TABLE {entry.table} ({column_defs})'
+        self.conn.execute(ddl)
+        if result.row_count:
+            placeholders = ", ".join("?" * len(names))
+            self.conn.executemany(f"INSERT INTO {entry.table} VALUES ({placeholders})", result.rows())
+        self.conn.commit()
+        entry.columns, entry.row_count, entry.ddl, entry.source = names, result.row_count, ddl, None
+
+    def add(self, question: str, sql: str, result: Optional[QueryResult] = None, from_session: bool = False,
+            source: Optional[str] = None) -> str:
+        """
+        Store a result as the next result_N table. Without `result` the entry
+        is deferred: `sql` is only run on the `source` database by materialize,
+        once a follow-up actually needs it.
+        """
+        with self.lock:
+            self.counter += 1
+            table = f"{TABLE_PREFIX}{self.counter}"
+            entry = SessionResult(table, question, sql, [], 0, "", from_session, source)
+            if result is not None:
+                self._create_table(entry, result)
+            self.results[table] = entry
+            while len(self.results) > Config.SESSION_MAX_RESULTS:
+                old, _ = self.results.popitem(last=False)
+                self.conn.execute(f"DROP TABLE IF EXISTS {old}")
+            self.last_used = time.monotonic()
+        _count("stored" if result is not None else "deferred")
+        return table
+
+    def materialize(self) -> None:
+        """Run the SQL of deferred results (up to SESSION_MAX_ROWS rows each); ones that fail are dropped."""
+        with self.lock:
+            deferred = [entry for entry in self.results.values() if entry.source]
+        for entry in deferred:
+            try:
+                result = run_cached_query(entry.source, entry.sql, guard=ExecutionGuard(max_rows=Config.SESSION_MAX_ROWS))
+            except Exception as e:
+                if not isinstance(e, QueryAborted):
+                    print("Could not load an earlier result for a follow-up:", e)
+                _count("too_large")
+                with self.lock:
+                    self.results.pop(entry.table, None)
+                continue
+            with self.lock:
+                if self.results.get(entry.table) is entry:
+                    self._create_table(entry, result)
+            _count("materialized")
+
+    def table_info(self) -> str:
+        """DDL of the stored results, newest first, each labelled with the question it answered."""
+        return "\n\n".join(f"-- {entry.table}: result of \"{entry.question}\" ({entry.row_count} rows)\n{entry.ddl}"
+                           for entry in reversed(self.results.values()))
+
+    def sample_data(self, rows: int) -> str:
+        lines = []
+        with self.lock:
+            for entry in reversed(self.results.values()):
+                cursor = self.conn.execute(f"SELECT * FROM {entry.table} LIMIT {int(rows)}")
+                for row in cursor.fetchall():
+                    lines.append(f"{entry.table}: " + ", ".join(f"{col}={value!r}" for col, value in zip(entry.columns, row)))
+        return "\n".join(lines)
+
+    def history(self) -> List[str]:
+        return [f"Previous question: {entry.question} -> stored as table {entry.table}"
+                for entry in self.results.values()]
+
+    def database_history(self) -> List[str]:
+        """The earlier questions and their SQL, for a follow-up that has to go back to the full database."""
+        return [f"Previous question: {entry.question}\nPrevious SQL: {entry.sql}"
+                for entry in self.results.values() if not entry.from_session]
+
+    @property
+    def columns(self) -> Dict[str, List[str]]:
+        return {entry.table: entry.columns for entry in self.results.values()}
+
+    def validate(self, sql: str) -> List[Dict]:
+        with self.lock:
+            return validate_on_connection(self.conn, sql)
+
+    def tables_read(self, sql: str) -> List[str]:
+        """Tables `sql` reads, collected while compiling it (nothing is executed)."""
+        read = set()
+
+        def authorize(action, arg1, arg2, db_name, trigger):
+            if action == sqlite3.SQLITE_READ and arg1:
+                read.add(arg1)
+            return sqlite3.SQLITE_OK
+
+        with self.lock:
+            self.conn.set_authorizer(authorize)
+            try:
+                self.conn.execute(f"EXPLAIN {sql}").fetchall()
+            finally:
+                self.conn.set_authorizer(None)
+        return sorted(read)
+
+    def run(self, sql: str, guard: Optional[ExecutionGuard] = None) -> QueryResult:
+        guard = guard or ExecutionGuard()
+        with self.lock, guard.attach(self.conn):
+            return QueryResult.from_cursor(self.conn.execute(sql), max_rows=guard.max_rows)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+            self.results.clear()
+
+
+_sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _expire_old() -> None:
+    now = time.monotonic()
+    for chat_id, session in list(_sessions.items()):
+        if now - session.last_used > Config.SESSION_TTL_SECONDS or len(_sessions) > Config.SESSION_MAX_CHATS:
+            _sessions.pop(chat_id).close()
+            _count("expired")
+
+
+def get_session(chat_id: Optional[str], create: bool = False) -> Optional[ChatSession]:
+    """The live session of a chat (refreshing its TTL), or None if it has no stored results."""
+    if not chat_id:
+        return None
+    with _lock:
+        _expire_old()
+        session = _sessions.get(chat_id)
+        if session is None and create:
+            session = _sessions[chat_id] = ChatSession(chat_id)
+        if session is not None:
+            _sessions.move_to_end(chat_id)
+            session.last_used = time.monotonic()
+    if session is not None and not create and not session.results:
+        return None
+    return session
+
+
+def remember_result(chat_id: Optional[str], question: str, sql: str, db_path: str, result: Dict, page: Dict) -> None:
+    """
+    Keep the answer to `question` for follow-ups. A result that fit in its first
+    page is stored as is; a longer one is only recorded, and read in full by
+    ChatSession.materialize when a follow-up arrives.
+    """
+    if not chat_id or Config.SESSION_MAX_RESULTS <= 0:
+        return
+    session = get_session(chat_id, create=True)
+    if page.get("next_cursor") is None:
+        session.add(question, sql, QueryResult.from_records(result["columns"], result["data"]))
+    else:
+        session.add(question, sql, source=db_path)
+
+
+def record_refinement(answered: bool) -> None:
+    """A follow-up was routed to the session; answered there, or fell back to the full database."""
+    with _stats_lock:
+        _stats["refinements"] += 1
+        _stats["answered" if answered else "fallbacks"] += 1
+
+
+def session_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        stats["sessions"] = len(_sessions)
+        stats["tables"] = sum(len(session.results) for session in _sessions.values())
+    return stats
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Latency samples kept per mode for the percentiles reported by /stats
+LATENCY_WINDOW = 1000
+
+_stats_lock = threading.Lock()
+_modes = ("sequential", "speculative")
+_latencies = {mode: deque(maxlen=LATENCY_WINDOW) for mode in _modes}
+_stats = {mode: {"runs": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0} for mode in _modes}
+_stats["speculative"].update({"races": 0, "cancelled": 0, "no_winner": 0, "wins": {}})
+
+
+class UsageCounter(BaseCallbackHandler):
+    """Adds up OpenAI token usage over every LLM call made for one question."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+        self.completion_tokens += usage.get("completion_tokens", 0) or 0
+
+
+async def race(candidates: List[Callable[[], Awaitable[Any]]], rank: Callable[[Any], int],
+               best: int) -> Tuple[int, Any, List[Any]]:
+    """
+    Run candidate coroutines concurrently and return (index, result, losers)
+    for the first one whose rank reaches `best`; the others are cancelled. If
+    none does, the highest-ranked result wins (earliest candidate on ties).
+    `losers` are the results of the other candidates that did finish. When
+    every candidate raised, the first exception is re-raised.
+    """
+    tasks = [asyncio.ensure_future(candidate()) for candidate in candidates]
+    finished: Dict[int, Any] = {}
+    errors: Dict[int, BaseException] = {}
+    winner: Optional[int] = None
+    try:
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.index):
+                i = tasks.index(task)
+                if task.exception() is not None:
+                    errors[i] = task.exception()
+                    continue
+                finished[i] = task.result()
+                if winner is None and rank(finished[i]) >= best:
+                    winner = i
+    finally:
+        # Losers (and everything, if the caller itself is cancelled) stop here:
+        # in-flight LLM requests are dropped and guarded queries interrupted
+        cancelled = [task for task in tasks if not task.done()]
+        for task in cancelled:
+            task.cancel()
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+        with _stats_lock:
+            _stats["speculative"]["races"] += 1
+            _stats["speculative"]["cancelled"] += len(cancelled)
+
+    if winner is None and finished:
+        winner = max(finished, key=lambda i: (rank(finished[i]), -i))
+    if winner is None:
+        with _stats_lock:
+            _stats["speculative"]["no_winner"] += 1
+        raise errors[min(errors)]
+    with _stats_lock:
+        wins = _stats["speculative"]["wins"]
+        wins[str(winner)] = wins.get(str(winner), 0) + 1
+    losers = [finished[i] for i in finished if i != winner]
+    return winner, finished[winner], losers
+
+
+def record_run(mode: str, seconds: float, usage: UsageCounter) -> None:
+    """Latency and token cost of one question that needed the LLM."""
+    with _stats_lock:
+        _latencies[mode].append(seconds)
+        stats = _stats[mode]
+        stats["runs"] += 1
+        stats["llm_calls"] += usage.calls
+        stats["prompt_tokens"] += usage.prompt_tokens
+        stats["completion_tokens"] += usage.completion_tokens
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def speculation_stats() -> Dict:
+    with _stats_lock:
+        report = {}
+        for mode in _modes:
+            stats = dict(_stats[mode])
+            if "wins" in stats:
+                stats["wins"] = dict(stats["wins"])
+            samples = list(_latencies[mode])
+            runs = stats["runs"]
+            stats["p50_ms"] = round(_percentile(samples, 0.5) * 1000, 1)
+            stats["p95_ms"] = round(_percentile(samples, 0.95) * 1000, 1)
+            stats["tokens_per_run"] = (stats["prompt_tokens"] + stats["completion_tokens"]) / runs if runs else 0.0
+            report[mode] = stats
+    return report
@@ -0,0 +1,259 @@
+import difflib
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from app.functions.sql_text import CODE, scan_sql
+from app.functions.sql_validator import split_statements
+
+# Rounds of repair -> re-validate before giving up and asking the LLM
+MAX_REPAIR_ROUNDS = 3
+NAME_CUTOFF = 0.6
+
+_stats_lock = threading.Lock()
+_stats = {"attempts": 0, "repaired": 0, "failed": 0, "fixes": {}}
+
+_IDENT = r"[\"`\[]?(\w+)[\"`\]]?"
+_FROM_RE = re.compile(r"\b(?:FROM|JOIN)\s+" + _IDENT + r"(?:\s+(?:AS\s+)?(?!(?:ON|USING|WHERE|JOIN|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|GROUP|ORDER|LIMIT|HAVING|UNION|EXCEPT|INTERSECT)\b)(\w+))?",
+                      re.IGNORECASE)
+
+
+def clean_sql(sql: str) -> Tuple[str, List[str]]:
+    """Mechanical cleanup of LLM output: fences, labels, stray semicolons."""
+    fixes = []
+    text = sql.strip()
+    fence = re.search(r"```(?:\w+)?\s*(.*?)```", text, re.DOTALL)
+    if fence:
+        text = fence.group(1).strip()
+        fixes.append("markdown_fence")
+    elif text.startswith("```"):
+        text = re.sub(r"^```\w*", "", text).strip()
+        fixes.append("markdown_fence")
+    labelled = re.sub(r"^\s*(SQLQuery|SQL|Query)\s*:\s*", "", text, flags=re.IGNORECASE)
+    if labelled != text:
+        text = labelled
+        fixes.append("label")
+    # Only outside literals and comments: 'hi ;) there' is data
+    inner = "".join(re.sub(r";\s*\)", ")", part) if kind == CODE else part for kind, part in scan_sql(text))
+    if inner != text:
+        text = inner
+        fixes.append("inner_semicolon")
+    stripped = text.rstrip().rstrip(";").rstrip()
+    if stripped != text.rstrip():
+        fixes.append("trailing_semicolon")
+    return stripped, fixes
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """alias (or table name) -> table, for the tables in FROM/JOIN clauses."""
+    aliases = {}
+    for table, alias in _FROM_RE.findall(sql):
+        aliases[table.lower()] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _closest(name: str, candidates: List[str]) -> Optional[str]:
+    lowered = {c.lower(): c for c in candidates}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    match = difflib.get_close_matches(name.lower(), list(lowered), n=1, cutoff=NAME_CUTOFF)
+    return lowered[match[0]] if match else None
+
+
+def _replace_ident(sql: str, old: str, new: str) -> str:
+    """Replace an identifier (optionally alias-qualified) outside string literals."""
+    parts = re.split(r"('(?:[^']|'')*')", sql)
+    pattern = re.compile(r"(?<![\w.])[\"`\[]?" + re.escape(old).replace(r"\.", r"[\"`\]]?\.[\"`\[]?") + r"[\"`\]]?(?![\w])")
+    return "".join(part if i % 2 else pattern.sub(new, part) for i, part in enumerate(parts))
+
+
+def _fix_column(sql: str, name: str, columns: Dict[str, List[str]]) -> Optional[str]:
+    aliases = _aliases(sql)
+    table_cols = {t.lower(): cols for t, cols in columns.items()}
+    referenced = [(table, alias) for table, alias in _FROM_RE.findall(sql) if table.lower() in table_cols]
+    if "." in name:
+        qualifier, column = name.rsplit(".", 1)
+        table = aliases.get(qualifier.lower(), qualifier)
+        fixed = _closest(column, table_cols.get(table.lower(), []))
+        if fixed and fixed.lower() != column.lower():
+            return _replace_ident(sql, name, f"{qualifier}.{fixed}")
+        # Right column, wrong alias: use the alias of a joined table that has it
+        owners = [alias or table for table, alias in referenced
+                  if column.lower() in {c.lower() for c in table_cols[table.lower()]}]
+        if owners:
+            return _replace_ident(sql, name, f"{owners[0]}.{column}")
+        return None
+    candidates = [c for table, _ in referenced for c in table_cols[table.lower()]]
+    fixed = _closest(name, candidates or [c for cols in columns.values() for c in cols])
+    if fixed and fixed.lower() != name.lower():
+        return _replace_ident(sql, name, fixed)
+    return None
+
+
+def _fix_ambiguous(sql: str, name: str, columns: Dict[str, List[str]]) -> Optional[str]:
+    # Qualify with the first FROM/JOIN table (by alias if it has one) that has the column
+    table_cols = {t.lower(): {c.lower() for c in cols} for t, cols in columns.items()}
+    for table, alias in _FROM_RE.findall(sql):
+        if name.lower() in table_cols.get(table.lower(), set()):
+            qualifier = alias or table
+            parts = re.split(r"('(?:[^']|'')*')", sql)
+            pattern = re.compile(r"(?<![\w.\"`\]])[\"`\[]?" + re.escape(name) + r"[\"`\]]?(?![\w.])")
+            return "".join(part if i % 2 else pattern.sub(f"{qualifier}.{name}", part) for i, part in enumerate(parts))
+    return None
+
+
+def _fix_table(sql: str, name: str, columns: Dict[str, List[str]]) -> Optional[str]:
+    fixed = _closest(name.split(".")[-1], list(columns))
+    if fixed and fixed.lower() != name.lower():
+        return _replace_ident(sql, name, fixed)
+    return None
+
+
+def _call_args(sql: str, start: int) -> Tuple[List[str], int]:
+    """Split the top-level arguments of the call whose '(' is at `start`; returns (args, index after ')')."""
+    depth, quote, args, current = 0, None, [], []
+    for i in range(start, len(sql)):
+        ch = sql[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+            if depth == 1:
+                continue
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                args.append("".join(current).strip())
+                return [a for a in args if a], i + 1
+        elif ch == "," and depth == 1:
+            args.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    raise ValueError("unbalanced parentheses")
+
+
+def _mysql_format(fmt: str) -> str:
+    # MySQL DATE_FORMAT specifiers that differ from strftime
+    return fmt.replace("%i", "%M").replace("%s", "%S").replace("%e", "%d").replace("%c", "%m")
+
+
+# MySQL / SQL Server functions and their SQLite spellings; each takes the argument list
+FUNCTION_REWRITES: Dict[str, Callable[[List[str]], Optional[str]]] = {
+    "now": lambda a: "datetime('now')",
+    "getdate": lambda a: "datetime('now')",
+    "curdate": lambda a: "date('now')",
+    "current_date": lambda a: "date('now')",
+    "year": lambda a: f"CAST(strftime('%Y', {a[0]}) AS INTEGER)" if len(a) == 1 else None,
+    "month": lambda a: f"CAST(strftime('%m', {a[0]}) AS INTEGER)" if len(a) == 1 else None,
+    "day": lambda a: f"CAST(strftime('%d', {a[0]}) AS INTEGER)" if len(a) == 1 else None,
+    "dayofmonth": lambda a: f"CAST(strftime('%d', {a[0]}) AS INTEGER)" if len(a) == 1 else None,
+    "hour": lambda a: f"CAST(strftime('%H', {a[0]}) AS INTEGER)" if len(a) == 1 else None,
+    "date_format": lambda a: f"strftime({_mysql_format(a[1])}, {a[0]})" if len(a) == 2 else None,
+    "datediff": lambda a: f"CAST(julianday({a[0]}) - julianday({a[1]}) AS INTEGER)" if len(a) == 2 else None,
+    "concat": lambda a: "(" + " || ".join(a) + ")" if a else None,
+    "isnull": lambda a: f"IFNULL({a[0]}, {a[1]})" if len(a) == 2 else None,
+    "len": lambda a: f"length({a[0]})" if len(a) == 1 else None,
+    "char_length": lambda a: f"length({a[0]})" if len(a) == 1 else None,
+    "lcase": lambda a: f"lower({a[0]})" if len(a) == 1 else None,
+    "ucase": lambda a: f"upper({a[0]})" if len(a) == 1 else None,
+    "substring": lambda a: f"substr({', '.join(a)})",
+    "rand": lambda a: "random()",
+}
+
+
+def _fix_function(sql: str, name: str) -> Optional[str]:
+    """Rewrite every call of a MySQL-only function into its SQLite spelling."""
+    rewrite = FUNCTION_REWRITES.get(name.lower())
+    if rewrite is None:
+        return None
+    pattern = re.compile(r"\b" + re.escape(name) + r"\s*\(", re.IGNORECASE)
+    position, rewritten = 0, False
+    while True:
+        match = pattern.search(sql, position)
+        if not match:
+            break
+        try:
+            args, end = _call_args(sql, match.end() - 1)
+        except ValueError:
+            return None
+        replacement = rewrite(args)
+        if replacement is None:
+            return None
+        sql = sql[:match.start()] + replacement + sql[end:]
+        position = match.start() + len(replacement)
+        rewritten = True
+    return sql if rewritten else None
+
+
+def _fix(sql: str, error: Dict, columns: Dict[str, List[str]]) -> Optional[str]:
+    code, name = error.get("code"), error.get("name") or ""
+    if code == "unknown_column":
+        return _fix_column(sql, name, columns)
+    if code == "ambiguous_column":
+        return _fix_ambiguous(sql, name, columns)
+    if code == "unknown_table":
+        return _fix_table(sql, name, columns)
+    if code == "unknown_function":
+        return _fix_function(sql, name)
+    if code == "multiple_statements":
+        # Keep the first statement if it's a query; the rest is usually commentary
+        statements = split_statements(sql)
+        return statements[0] if statements and statements[0] != sql else None
+    return None
+
+
+def schema_columns(conn) -> Dict[str, List[str]]:
+    """Column names per table read from an open SQLite connection."""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")]
+    return {table: [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')] for table in tables}
+
+
+def _record(fixes: List[str], ok: bool) -> None:
+    with _stats_lock:
+        _stats["attempts"] += 1
+        _stats["repaired" if ok else "failed"] += 1
+        if ok:
+            for fix in fixes:
+                _stats["fixes"][fix] = _stats["fixes"].get(fix, 0) + 1
+
+
+def repair_sql(sql: str, errors: List[Dict], columns: Dict[str, List[str]],
+               validate: Callable[[str], List[Dict]]) -> Tuple[Optional[str], List[str]]:
+    """
+    Try to fix a rejected query locally (schema-aware renames, MySQL function
+    rewrites, cleanup) and re-validate after each round. Returns the repaired
+    SQL and the list of fixes applied, or (None, []) when the LLM is needed.
+    """
+    fixes: List[str] = []
+    candidate, cleanup = clean_sql(sql)
+    fixes.extend(cleanup)
+    if cleanup:
+        errors = validate(candidate)
+    for _ in range(MAX_REPAIR_ROUNDS):
+        if not errors:
+            _record(fixes, True)
+            return candidate, fixes
+        fixed = _fix(candidate, errors[0], columns)
+        if fixed is None or fixed == candidate:
+            break
+        fixes.append(f"{errors[0]['code']}:{errors[0].get('name', '')}")
+        candidate = fixed
+        errors = validate(candidate)
+    if not errors and fixes:
+        _record(fixes, True)
+        return candidate, fixes
+    _record(fixes, False)
+    return None, []
+
+
+def repair_stats() -> Dict:
+    with _stats_lock:
+        stats = {**_stats, "fixes": dict(_stats["fixes"])}
+    stats["success_rate"] = stats["repaired"] / stats["attempts"] if stats["attempts"] else 0.0
+    return stats
@@ -0,0 +1,55 @@
+from typing import Iterator, Tuple
+
+CODE = "code"
+LITERAL = "literal"
+IDENTIFIER = "identifier"
+COMMENT = "comment"
+
+# Opening character of a quoted token -> (closing character, kind)
+_QUOTES = {"'": ("'", LITERAL), '"': ('"', IDENTIFIER), "`": ("`", IDENTIFIER), "[": ("]", IDENTIFIER)}
+
+
+def scan_sql(sql: str) -> Iterator[Tuple[str, str]]:
+    """
+    Split SQL text into (kind, text) segments: string literals, quoted
+    identifiers, comments and the code between them. Comment markers inside
+    quotes are just text, a doubled quote ('it''s') stays inside its token and
+    an unterminated quote or block comment runs to the end of the input.
+    Concatenating the texts gives back `sql` unchanged.
+    """
+    i, start, n = 0, 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in _QUOTES:
+            close, kind = _QUOTES[ch]
+            end = i + 1
+            while end < n:
+                if sql[end] == close:
+                    if close != "]" and end + 1 < n and sql[end + 1] == close:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            end = min(end + 1, n)
+        elif sql.startswith("--", i):
+            kind = COMMENT
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+        elif sql.startswith("/*", i):
+            kind = COMMENT
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+        else:
+            i += 1
+            continue
+        if start < i:
+            yield CODE, sql[start:i]
+        yield kind, sql[i:end]
+        i = start = end
+    if start < n:
+        yield CODE, sql[start:]
+
+
+def strip_comments(sql: str) -> str:
+    """`sql` with every comment outside literals and quoted identifiers replaced by a space."""
+    return "".join(" " if kind == COMMENT else text for kind, text in scan_sql(sql))
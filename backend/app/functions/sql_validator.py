@@ -0,0 +1,193 @@
+import difflib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.config import Config
+from app.functions.sql_text import CODE, scan_sql, strip_comments
+
+# Statement kinds a generated query may start with
+READ_KEYWORDS = ("select", "with", "values")
+
+# Authorizer actions allowed while compiling a candidate; anything else (writes,
+# PRAGMA, ATTACH, temp objects, ...) means it isn't a plain read
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                    getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+
+_ERROR_PATTERNS = [
+    ("unknown_table", re.compile(r"no such table: (?P<name>\S+)")),
+    ("unknown_column", re.compile(r"no such column: (?P<name>\S+)")),
+    ("ambiguous_column", re.compile(r"ambiguous column name: (?P<name>\S+)")),
+    ("unknown_function", re.compile(r"no such function: (?P<name>\S+)")),
+    ("syntax_error", re.compile(r'near "(?P<name>.*)": syntax error')),
+    ("syntax_error", re.compile(r"incomplete input")),
+    ("not_select", re.compile(r"not authorized")),
+]
+
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "rejected": 0, "codes": {}}
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split on semicolons that are outside string literals, quoted identifiers and comments."""
+    statements, current = [], []
+    for kind, text in scan_sql(sql):
+        if kind != CODE:
+            current.append(text)
+            continue
+        pieces = text.split(";")
+        current.append(pieces[0])
+        for piece in pieces[1:]:
+            statements.append("".join(current))
+            current = [piece]
+    statements.append("".join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _error(code: str, message: str, name: Optional[str] = None, suggestions: Optional[List[str]] = None) -> Dict:
+    error = {"code": code, "message": message}
+    if name:
+        error["name"] = name
+    if suggestions:
+        error["suggestions"] = suggestions
+    return error
+
+
+def _suggest(code: str, name: str, columns: Optional[Dict[str, List[str]]]) -> List[str]:
+    if not columns:
+        return []
+    bare = name.split(".")[-1].strip('"`[]')
+    if code == "unknown_table":
+        return difflib.get_close_matches(bare, list(columns), n=3, cutoff=0.5)
+    if code == "unknown_column":
+        qualified = [f"{table}.{col}" for table, cols in columns.items() for col in cols]
+        matches = difflib.get_close_matches(bare.lower(), [q.split(".", 1)[1].lower() for q in qualified], n=3, cutoff=0.6)
+        return [q for q in qualified if q.split(".", 1)[1].lower() in matches][:5]
+    if code == "ambiguous_column":
+        return [f"{table}.{col}" for table, cols in columns.items() for col in cols if col.lower() == bare.lower()]
+    return []
+
+
+def _classify(exc: Exception, columns: Optional[Dict[str, List[str]]]) -> Dict:
+    text = str(exc)
+    for code, pattern in _ERROR_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            name = match.groupdict().get("name")
+            if code == "not_select":
+                return _error(code, "Only read-only SELECT queries are allowed")
+            return _error(code, text, name, _suggest(code, name or "", columns))
+    return _error("invalid", text)
+
+
+def _authorize(action, arg1, arg2, db_name, trigger):
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def explain_errors(conn: sqlite3.Connection, sql: str, columns: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+    """
+    Static checks for one candidate query on `conn`. The statement is only
+    compiled (EXPLAIN QUERY PLAN), so no table data is read. Returns a list of
+    structured errors; an empty list means the query is safe to execute.
+    """
+    statements = split_statements(strip_comments(sql))
+    if not statements:
+        return [_error("empty", "The SQL query is empty")]
+    if len(statements) > 1:
+        return [_error("multiple_statements", "Return exactly one SELECT statement")]
+    statement = statements[0]
+    keyword = re.match(r"[\s(]*(\w+)", statement)
+    if not keyword or keyword.group(1).lower() not in READ_KEYWORDS:
+        found = keyword.group(1).upper() if keyword else statement[:20]
+        return [_error("not_select", f"Only read-only SELECT queries are allowed, got {found}", found)]
+
+    conn.set_authorizer(_authorize)
+    try:
+        conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    except sqlite3.Error as e:
+        return [_classify(e, columns)]
+    finally:
+        conn.set_authorizer(None)
+    return []
+
+
+class _Shadow:
+    """Schema-only in-memory copy of a project database, used to compile candidates."""
+
+    def __init__(self, ddl: List[str]):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        for statement in ddl:
+            # Virtual tables etc. may need modules this build lacks; EXPLAIN then reports them as unknown
+            try:
+                self.conn.execute(statement)
+            except sqlite3.Error:
+                pass
+
+
+_shadows: "OrderedDict[Tuple[str, Tuple[int, int]], _Shadow]" = OrderedDict()
+_shadows_lock = threading.Lock()
+
+
+def _shadow_for(catalog) -> _Shadow:
+    key = (os.path.abspath(catalog.db_path), catalog.signature)
+    with _shadows_lock:
+        shadow = _shadows.get(key)
+        if shadow is not None:
+            _shadows.move_to_end(key)
+            return shadow
+    shadow = _Shadow(catalog.ddl)
+    with _shadows_lock:
+        # Drop copies of older versions of the same file, then keep the LRU bounded
+        for stale in [k for k in _shadows if k[0] == key[0]]:
+            _shadows.pop(stale).conn.close()
+        _shadows[key] = shadow
+        while len(_shadows) > Config.CATALOG_MAX_ENTRIES:
+            _shadows.popitem(last=False)[1].conn.close()
+    return shadow
+
+
+def _record(errors: List[Dict]) -> None:
+    with _stats_lock:
+        _stats["checked"] += 1
+        if errors:
+            _stats["rejected"] += 1
+            code = errors[0]["code"]
+            _stats["codes"][code] = _stats["codes"].get(code, 0) + 1
+
+
+def validate_sql(catalog, sql: str) -> List[Dict]:
+    """
+    Validate a candidate against the cached schema of `catalog` (a
+    schema_catalog.CatalogEntry) without opening the project file.
+    """
+    shadow = _shadow_for(catalog)
+    with shadow.lock:
+        errors = explain_errors(shadow.conn, sql, catalog.columns)
+    _record(errors)
+    return errors
+
+
+def validate_on_connection(conn: sqlite3.Connection, sql: str) -> List[Dict]:
+    """Same checks directly on an open connection (still compile-only)."""
+    errors = explain_errors(conn, sql)
+    _record(errors)
+    return errors
+
+
+def format_errors(errors: List[Dict]) -> str:
+    """One line per error, worded for the LLM retry prompt."""
+    lines = []
+    for error in errors:
+        line = f"{error['code']}: {error['message']}"
+        if error.get("suggestions"):
+            line += f" (did you mean: {', '.join(error['suggestions'])}?)"
+        lines.append(line)
+    return "SQL validation failed: " + "; ".join(lines)
+
+
+def validator_stats() -> Dict:
+    with _stats_lock:
+        return {**_stats, "codes": dict(_stats["codes"]), "shadows": len(_shadows)}
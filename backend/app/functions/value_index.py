@@ -0,0 +1,279 @@
+import bisect
+import difflib
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.config import Config
+from app.functions.db_pool import pooled_connection
+from app.functions.schema_catalog import file_signature
+
+# Columns with a declared type like these (or no type at all) are candidates for the index
+TEXT_TYPE_RE = re.compile(r"char|text|clob|string|^$", re.IGNORECASE)
+INDEX_SUFFIX = ".values.json.gz"
+
+_stats_lock = threading.Lock()
+_stats = {"builds": 0, "loads": 0, "hints": 0, "literals_checked": 0, "literals_snapped": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _norm(value: str) -> str:
+    return re.sub(r"\s+", " ", value.strip().lower())
+
+
+class ValueIndex:
+    """
+    Distinct values of the low/medium-cardinality text columns of one database.
+
+    Kept as one sorted array of normalized values (with a parallel array of
+    (value, table, column)) so a prefix lookup is a bisect, plus a per-column
+    sorted list for snapping literals in generated SQL.
+    """
+
+    def __init__(self, signature: Tuple[int, int], columns: List[Tuple[str, str, List[str]]]):
+        self.signature = tuple(signature)
+        self.columns = columns
+        self.by_column: Dict[Tuple[str, str], List[str]] = {}
+        pairs = []
+        for table, column, values in columns:
+            self.by_column[(table.lower(), column.lower())] = values
+            pairs.extend((_norm(value), value, table, column) for value in values)
+        pairs.sort()
+        self.keys = [p[0] for p in pairs]
+        self.entries = [p[1:] for p in pairs]
+
+    def prefix(self, term: str, limit: int = 5) -> List[Tuple[str, str, str]]:
+        term = _norm(term)
+        start = bisect.bisect_left(self.keys, term)
+        matches = []
+        for i in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[i].startswith(term):
+                break
+            matches.append(self.entries[i])
+        return matches
+
+    def exact(self, term: str) -> List[Tuple[str, str, str]]:
+        term = _norm(term)
+        start = bisect.bisect_left(self.keys, term)
+        matches = []
+        for i in range(start, len(self.keys)):
+            if self.keys[i] != term:
+                break
+            matches.append(self.entries[i])
+        return matches
+
+    def to_json(self) -> Dict:
+        return {"signature": list(self.signature), "columns": self.columns}
+
+
+def _index_path(db_path: str) -> str:
+    return db_path + INDEX_SUFFIX
+
+
+def build_value_index(db_path: str) -> ValueIndex:
+    """
+    Scan the text columns of a database and save their distinct values next
+    to it. Columns with more than VALUE_INDEX_MAX_DISTINCT values (names,
+    free text, ids) are skipped; they're not useful for grounding literals.
+    """
+    signature = file_signature(db_path)
+    columns = []
+    with pooled_connection(db_path) as conn:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall():
+                column, declared = row[1], row[2] or ""
+                if not TEXT_TYPE_RE.search(declared):
+                    continue
+                values = [r[0] for r in conn.execute(
+                    f'SELECT DISTINCT "{column}" FROM "{table}" WHERE typeof("{column}") = \'text\' '
+                    f'AND length("{column}") <= ? LIMIT ?',
+                    (Config.VALUE_INDEX_MAX_VALUE_CHARS, Config.VALUE_INDEX_MAX_DISTINCT + 1)
+                )]
+                if values and len(values) <= Config.VALUE_INDEX_MAX_DISTINCT:
+                    columns.append((table, column, sorted(values)))
+
+    index = ValueIndex(signature, columns)
+    try:
+        with gzip.open(_index_path(db_path), "wt", encoding="utf-8") as f:
+            json.dump(index.to_json(), f, separators=(",", ":"))
+    except OSError as e:
+        print("Could not save value index:", e)
+    _count("builds")
+    return index
+
+
+def _load(db_path: str, signature: Tuple[int, int]) -> Optional[ValueIndex]:
+    try:
+        with gzip.open(_index_path(db_path), "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if tuple(data.get("signature", ())) != tuple(signature):
+        return None
+    _count("loads")
+    return ValueIndex(signature, [tuple(c) for c in data["columns"]])
+
+
+_indexes: "OrderedDict[str, ValueIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_value_index(db_path: str) -> Optional[ValueIndex]:
+    """
+    Cached index for a project database: from memory, else from the file saved
+    at upload time, else rebuilt (older projects, or the file changed).
+    """
+    key = os.path.abspath(db_path)
+    try:
+        signature = file_signature(key)
+    except OSError:
+        return None
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None and index.signature == signature:
+            _indexes.move_to_end(key)
+            return index
+    index = _load(key, signature)
+    if index is None:
+        try:
+            index = build_value_index(key)
+        except Exception as e:
+            print("Could not build value index:", e)
+            return None
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > Config.CATALOG_MAX_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _question_terms(question: str) -> List[str]:
+    quoted = re.findall(r"['\"]([^'\"]+)['\"]", question)
+    words = re.findall(r"[\w][\w&.'-]*", question)
+    # Multi-word values ("New York", "on hold") are matched as 2-3 word phrases
+    phrases = [" ".join(words[i:i + n]) for n in (3, 2) for i in range(len(words) - n + 1)]
+    return quoted + phrases + words
+
+
+def value_hints(index: Optional[ValueIndex], question: str, tables: Optional[List[str]] = None) -> str:
+    """
+    Prompt lines naming stored values that match terms in the question, e.g.
+    orders.status: 'Active'. Exact (case-insensitive) matches first, then
+    prefix matches for words of 3+ characters.
+    """
+    if index is None:
+        return "(none)"
+    allowed = {t.lower() for t in tables} if tables else None
+    found: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+    seen = set()
+    for term in _question_terms(question):
+        matches = index.exact(term)
+        if not matches and len(term) >= 3 and " " not in term:
+            matches = index.prefix(term, limit=3)
+        for value, table, column in matches:
+            if allowed is not None and table.lower() not in allowed:
+                continue
+            if (value, table, column) in seen:
+                continue
+            seen.add((value, table, column))
+            found.setdefault((table, column), []).append(value)
+        if len(seen) >= Config.VALUE_INDEX_MAX_HINTS:
+            break
+    if not found:
+        return "(none)"
+    _count("hints", len(seen))
+    return "\n".join(f"{table}.{column}: " + ", ".join(repr(v) for v in values) for (table, column), values in found.items())
+
+
+# col = 'x', col != 'x', col <> 'x', col IN ('x', 'y'), optionally alias-qualified and quoted
+_COMPARISON_RE = re.compile(
+    r"(?P<col>(?:[\"`\[]?\w+[\"`\]]?\.)?[\"`\[]?\w+[\"`\]]?)\s*(?P<op>=|!=|<>|\bIN\b)\s*(?P<rhs>\((?:\s*'(?:[^']|'')*'\s*,?)+\)|'(?:[^']|'')*')",
+    re.IGNORECASE,
+)
+_LITERAL_RE = re.compile(r"'((?:[^']|'')*)'")
+
+
+def _column_values(index: ValueIndex, sql: str, column_ref: str) -> List[str]:
+    column = column_ref.split(".")[-1].strip("\"`[]").lower()
+    referenced = {t.lower() for t in re.findall(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", sql, re.IGNORECASE)}
+    values = []
+    for (table, col), col_values in index.by_column.items():
+        if col == column and (not referenced or table in referenced):
+            values.extend(col_values)
+    return values
+
+
+# Only words are fuzzy-matched: anything with a digit, an underscore or in all capitals
+# ('2024-03-30', 'SKU-104', 'USD') is a key whose near neighbours are different values
+_WORDS_RE = re.compile(r"[^\W\d_]+(?:[ '&.-]+[^\W\d_]+)*")
+
+
+def _snappable(value: str) -> bool:
+    return len(value) >= 4 and bool(_WORDS_RE.fullmatch(value)) and not value.isupper()
+
+
+def _closest(literal: str, values: List[str]) -> Optional[str]:
+    """
+    The stored value `literal` was meant to be, or None to leave it alone:
+    the one value equal to it after case and whitespace folding, else for a
+    plain word the single value within VALUE_INDEX_SNAP_CUTOFF of it.
+    """
+    if literal in values:
+        return None
+    folded: Dict[str, List[str]] = {}
+    for value in values:
+        folded.setdefault(_norm(value), []).append(value)
+    same = folded.get(_norm(literal))
+    if same:
+        return same[0] if len(same) == 1 else None
+    if not _snappable(literal.strip()):
+        return None
+    candidates = [key for key, group in folded.items() if len(group) == 1 and _snappable(group[0])]
+    matches = difflib.get_close_matches(_norm(literal), candidates, n=2, cutoff=Config.VALUE_INDEX_SNAP_CUTOFF)
+    return folded[matches[0]][0] if len(matches) == 1 else None
+
+
+def snap_literals(index: Optional[ValueIndex], sql: str) -> Tuple[str, List[Dict]]:
+    """
+    Rewrite string literals compared with = / != / IN against an indexed
+    column to the value that actually exists ('active' -> 'Active',
+    'Pariss' -> 'Paris'). Dates, numbers and codes are only matched up to
+    case and whitespace. Returns the new SQL and a list of the changes.
+    """
+    if index is None or "'" not in sql:
+        return sql, []
+    changes = []
+
+    def fix_comparison(match):
+        values = _column_values(index, sql, match.group("col"))
+        if not values:
+            return match.group(0)
+
+        def fix_literal(lit):
+            literal = lit.group(1).replace("''", "'")
+            _count("literals_checked")
+            replacement = _closest(literal, values)
+            if replacement is None:
+                return lit.group(0)
+            _count("literals_snapped")
+            changes.append({"column": match.group("col"), "from": literal, "to": replacement})
+            return "'" + replacement.replace("'", "''") + "'"
+
+        rhs = _LITERAL_RE.sub(fix_literal, match.group("rhs"))
+        return match.group(0)[:match.start("rhs") - match.start(0)] + rhs
+
+    return _COMPARISON_RE.sub(fix_comparison, sql), changes
+
+
+def value_index_stats() -> Dict:
+    with _stats_lock:
+        return {**_stats, "indexes": len(_indexes)}
@@ -3,54 +3,38 @@ import pandas as pd
 import os
 import re
 from dotenv import load_dotenv
-import sqlite3
+from app.functions.db_pool import pooled_connection
+from app.functions.concurrency import llm_slot, run_chart
+from app.functions.chart_rules import results_to_dataframe, try_fast_chart
 
 def get_sqlite_schema(db_path: str):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Get table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-
-    schema = {}
-    for table_name_tuple in tables:
-        table_name = table_name_tuple[0]
-        cursor.execute(f"PRAGMA table_info('{table_name}');")
-        columns = cursor.fetchall()
-        schema[table_name] = [
-            {"cid": col[0], "name": col[1], "type": col[2], "notnull": col[3], "default": col[4], "pk": col[5]}
-            for col in columns
-        ]
-
-    conn.close()
+    with pooled_connection(db_path) as conn:
+        cursor = conn.cursor()
+
+        # Get table names
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = cursor.fetchall()
+
+        schema = {}
+        for table_name_tuple in tables:
+            table_name = table_name_tuple[0]
+            cursor.execute(f"PRAGMA table_info('{table_name}');")
+            columns = cursor.fetchall()
+            schema[table_name] = [
+                {"cid": col[0], "name": col[1], "type": col[2], "notnull": col[3], "default": col[4], "pk": col[5]}
+                for col in columns
+            ]
+
     return schema
 
 # Load environment variables
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-def visualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5) -> None:
-    """
-    Generate a high-quality, interactive data visualization using Google Gemini and Python libraries.
-
-    Args:
-        df (pd.DataFrame): The input dataframe containing the data.
-        output_path (str): File path to save the generated visualization.
-        model_name (str): Gemini model to use (default: gemini-2.0-flash)
-        max_retries (int): Max attempts to retry visualization generation upon error.
-
-    Returns:
-        None
-    """
-    try:
-        data_description = str(results)
-
-    except Exception as e:
-        print("Error while describing data:", e)
-        return
+def build_visualization_prompt(results, output_path) -> str:
+    data_description = str(results)
 
-    base_prompt = f"""
+    return f"""
     You are a professional data visualization expert skilled in **creating advanced, high-quality, and visually appealing charts**.
 
     ### **Task:**
@@ -80,6 +64,35 @@ def visualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5
 
     """
 
+
+def run_generated_code(code: str, results=None, output_path=None) -> None:
+    # Same names the generated code could see when it was exec'd inside visualise()
+    exec(code, {"__name__": "__generated_visualization__", "pd": pd, "os": os, "results": results, "output_path": output_path})
+
+
+def visualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5) -> None:
+    """
+    Generate a high-quality, interactive data visualization using Google Gemini and Python libraries.
+
+    Args:
+        df (pd.DataFrame): The input dataframe containing the data.
+        output_path (str): File path to save the generated visualization.
+        model_name (str): Gemini model to use (default: gemini-2.0-flash)
+        max_retries (int): Max attempts to retry visualization generation upon error.
+
+    Returns:
+        None
+    """
+    # Simple result shapes are charted directly without Gemini
+    if try_fast_chart(results_to_dataframe(results), output_path):
+        return output_path
+
+    try:
+        base_prompt = build_visualization_prompt(results, output_path)
+    except Exception as e:
+        print("Error while describing data:", e)
+        return
+
     model_instance = genai.GenerativeModel(model_name)
 
     for attempt in range(1, max_retries + 1):
@@ -94,7 +107,7 @@ def visualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5
 
             extracted_code = code_match.group(1).strip()
             print("⚙️ Running generated code...\n")
-            exec(extracted_code)
+            run_generated_code(extracted_code, results, output_path)
             print("✅ Visualization generated successfully.")
             return output_path # Exit loop if execution succeeds
 
@@ -105,3 +118,46 @@ def visualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5
             if attempt == max_retries:
                 print("❌ Max retries reached. Unable to generate a working visualization.")
                 return None
+
+
+async def avisualise(results, output_path, model_name="gemini-2.0-flash", max_retries=5):
+    """
+    Async version of visualise for the FastAPI event loop: Gemini is called
+    through its async client and the generated code runs on the chart executor.
+    """
+    # Simple result shapes are charted directly without Gemini
+    if await run_chart(try_fast_chart, results_to_dataframe(results), output_path):
+        return output_path
+
+    try:
+        base_prompt = build_visualization_prompt(results, output_path)
+    except Exception as e:
+        print("Error while describing data:", e)
+        return None
+
+    model_instance = genai.GenerativeModel(model_name)
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            print(f"\n🌀 Attempt {attempt}: Generating visualization prompt...")
+            async with llm_slot():
+                response = await model_instance.generate_content_async(base_prompt)
+            code_match = re.search(r"```python\n(.*?)```", response.text, re.DOTALL)
+
+            if not code_match:
+                print("❌ No valid Python code block found in model response.")
+                continue
+
+            extracted_code = code_match.group(1).strip()
+            print("⚙️ Running generated code...\n")
+            await run_chart(run_generated_code, extracted_code, results, output_path)
+            print("✅ Visualization generated successfully.")
+            return output_path
+
+        except Exception as e:
+            print(f"🚨 Error during execution: {e}")
+            error_feedback = f"\n\n⚠️ The previous code caused the following error:\n{e}\n\nFix it and regenerate the full corrected code.Saving graph to image is important with {output_path}"
+            base_prompt += error_feedback
+            if attempt == max_retries:
+                print("❌ Max retries reached. Unable to generate a working visualization.")
+                return None
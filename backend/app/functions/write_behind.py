@@ -0,0 +1,144 @@
+import asyncio
+import atexit
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.config import Config
+from app.functions.mongo import db
+
+DUPLICATE_KEY = 11000
+
+_lock = threading.Lock()
+# Held for the whole of a flush, so flush() returns only once earlier batches are written too
+_flush_lock = threading.Lock()
+_pending: Dict[str, Deque[Dict]] = {}
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "written": 0, "batches": 0, "sync_writes": 0, "backpressure": 0,
+          "retried": 0, "dropped": 0, "failed_batches": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _pending_total() -> int:
+    return sum(len(queue) for queue in _pending.values())
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run, name="write-behind", daemon=True)
+        _worker.start()
+
+
+def _run() -> None:
+    while True:
+        _wake.wait(Config.WRITE_BEHIND_FLUSH_SECONDS)
+        _wake.clear()
+        flush()
+
+
+def _write(collection: str, batch: List[Dict]) -> None:
+    try:
+        db[collection].insert_many(batch, ordered=False)
+        written = len(batch)
+    except BulkWriteError as e:
+        # Duplicates were written by an earlier attempt; anything else won't succeed on retry
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+        written = len(batch) - len(errors)
+        _count("dropped", len(errors))
+        for error in errors:
+            print(f"Write-behind insert into {collection} failed:", error.get("errmsg"))
+    except Exception as e:
+        # Server unreachable and the like: put the batch back for the next flush, within the bound
+        print(f"Write-behind flush of {collection} failed:", e)
+        _count("failed_batches")
+        with _lock:
+            queue = _pending.setdefault(collection, deque())
+            room = max(0, Config.WRITE_BEHIND_MAX_PENDING - _pending_total())
+            queue.extendleft(reversed(batch[:room]))
+        _count("retried", min(room, len(batch)))
+        _count("dropped", len(batch) - min(room, len(batch)))
+        return
+    with _stats_lock:
+        _stats["written"] += written
+        _stats["batches"] += 1
+
+
+def flush(collection: Optional[str] = None) -> None:
+    """Write everything queued (for one collection, or all) and wait until it is written."""
+    with _flush_lock:
+        with _lock:
+            names = [collection] if collection else list(_pending)
+            batches = [(name, list(_pending.pop(name, ()))) for name in names]
+        for name, batch in batches:
+            for start in range(0, len(batch), Config.WRITE_BEHIND_BATCH_SIZE):
+                _write(name, batch[start:start + Config.WRITE_BEHIND_BATCH_SIZE])
+
+
+def insert(collection: str, doc: Dict) -> None:
+    """
+    Queue `doc` for insertion into `collection`. It is written with others in
+    one insert_many when WRITE_BEHIND_BATCH_SIZE documents are waiting, or at
+    most WRITE_BEHIND_FLUSH_SECONDS later. The _id is assigned here, so it
+    orders like an immediate insert. With WRITE_BEHIND_MODE "sync" the
+    document is inserted before returning. When WRITE_BEHIND_MAX_PENDING
+    documents are already queued, the caller flushes them first.
+    """
+    doc.setdefault("_id", ObjectId())
+    if Config.WRITE_BEHIND_MODE == "sync":
+        db[collection].insert_one(doc)
+        _count("sync_writes")
+        return
+    with _lock:
+        full = _pending_total() >= Config.WRITE_BEHIND_MAX_PENDING
+    if full:
+        _count("backpressure")
+        flush()
+    with _lock:
+        queue = _pending.setdefault(collection, deque())
+        queue.append(doc)
+        batch_ready = len(queue) >= Config.WRITE_BEHIND_BATCH_SIZE
+    _count("queued")
+    _ensure_worker()
+    if batch_ready:
+        _wake.set()
+
+
+async def ainsert(collection: str, doc: Dict) -> None:
+    """insert() for the event loop: only a sync-mode write or a backpressure flush leaves the loop."""
+    with _lock:
+        blocking = Config.WRITE_BEHIND_MODE == "sync" or _pending_total() >= Config.WRITE_BEHIND_MAX_PENDING
+    if blocking:
+        await asyncio.to_thread(insert, collection, doc)
+    else:
+        insert(collection, doc)
+
+
+async def aflush(collection: Optional[str] = None) -> None:
+    """flush() off the event loop, e.g. before updating a document that may still be queued."""
+    with _lock:
+        empty = not _pending.get(collection) if collection else not _pending_total()
+    if empty and not _flush_lock.locked():
+        return
+    await asyncio.to_thread(flush, collection)
+
+
+def write_behind_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        stats["pending"] = {name: len(queue) for name, queue in _pending.items() if queue}
+    stats["mode"] = Config.WRITE_BEHIND_MODE
+    return stats
+
+
+# Graceful shutdown (FastAPI also flushes in its shutdown hook); a hard kill loses at most one interval
+atexit.register(flush)
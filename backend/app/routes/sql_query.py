@@ -10,6 +10,7 @@ from langgraph.graph import StateGraph, END
 from typing import TypedDict, List, Optional, Dict
 from sqlalchemy import text
 from dotenv import load_dotenv
+from app.functions.example_store import ProjectExampleSelector, add_example
 import logging
 
 # Load env vars
@@ -25,6 +26,7 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Globals
 db: Optional[SQLDatabase] = None
+db_path: str = ""
 table_info_str: str = ""
 sample_data: Dict[str, List[Dict]] = {}
 llm_history: List[str] = []
@@ -41,25 +43,14 @@ class QueryState(TypedDict):
     result: Optional[dict]
     retries: int
 
-# Placeholder examples
-examples = [
-    {
-        "input": "New question: list recent entries from table1",
-        "answer": "SELECT * FROM table1 ORDER BY created_at DESC LIMIT 5;"
-    },
-    {
-        "input": "Continue question: filter above by status = 'active'",
-        "answer": "SELECT * FROM table1 WHERE status = 'active' ORDER BY created_at DESC LIMIT 5;"
-    }
-]
-
 example_prompt = PromptTemplate(
     input_variables=["input", "answer"],
     template="Question: {input}\nSQLQuery: {answer}"
 )
 
 PROMPT = FewShotPromptTemplate(
-    examples=examples,
+    # Past answers for the uploaded database most similar to the question (see example_store)
+    example_selector=ProjectExampleSelector(),
     example_prompt=example_prompt,
     input_variables=['input', 'table_info', 'sample_data', 'top_k', 'history'],  # Added history
     prefix="""
@@ -86,7 +77,7 @@ def allowed_file(filename: str) -> bool:
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    global db, table_info_str, sample_data
+    global db, db_path, table_info_str, sample_data
 
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -100,6 +91,7 @@ def upload_file():
     filename = secure_filename(file.filename)
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(filepath)
+    db_path = filepath
     db = SQLDatabase.from_uri(f"sqlite:///{filepath}")
 
     # Get full schema description string
@@ -140,6 +132,8 @@ def ask_question():
     try:
         out = graph.invoke(state)
         print(f"Graph output: {out}")
+        if 'error' not in (out['result'] or {}):
+            add_example(db_path, question, out['sql_query'])
         return jsonify({
             'sql_query': out['sql_query'],
             'result': out['result'],
@@ -163,7 +157,8 @@ def create_graph():
             "history": "\n".join(state['history'][-HISTORY_WINDOW_SIZE:]),  
             "table_info": table_info_str,
             "sample_data": sample_data,
-            "top_k": 5
+            "top_k": 5,
+            "project": db_path
         }
         resp = chain.invoke(inp)
 
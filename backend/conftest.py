@@ -0,0 +1,5 @@
+import os
+
+# app.config reads these at import time; the tests below never connect to either service
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,28 @@
+import pytest
+from app.config import Config
+from app.functions.query_cache import lookup_sql, store_sql
+
+SIGNATURE = (1, 1)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "QUERY_CACHE_ENABLED", True)
+    path = str(tmp_path / "project.db")
+    store_sql(path, SIGNATURE, "What is the average order amount per customer region in 2024?",
+              "SELECT region, AVG(amount) FROM orders WHERE year = 2024 GROUP BY region")
+    return path
+
+
+def test_reworded_question_is_a_fuzzy_hit(db_path):
+    hit = lookup_sql(db_path, SIGNATURE, "Show me the average order amounts per customer regions in 2024")
+    assert hit is not None and hit["match"] == "fuzzy"
+
+
+@pytest.mark.parametrize("question", [
+    "What is the total order amount per customer region in 2024?",
+    "What is the average order amount per customer country in 2024?",
+    "What is the average order quantity per customer region in 2024?",
+])
+def test_one_different_word_is_a_miss(db_path, question):
+    assert lookup_sql(db_path, SIGNATURE, question) is None
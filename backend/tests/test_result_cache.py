@@ -0,0 +1,49 @@
+import sqlite3
+import pytest
+from app.config import Config
+from app.functions import result_cache
+from app.functions.result_cache import invalidate_results, run_cached_query
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "project.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER, name TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(100)])
+    conn.commit()
+    conn.close()
+    yield path
+    invalidate_results(path)
+
+
+def test_callers_cannot_change_the_cached_result(db_path):
+    first = run_cached_query(db_path, "SELECT id, name FROM t")
+    with pytest.raises(ValueError):
+        first.column_data[0][0] = -1
+    first.columns[0] = "renamed"
+    df = first.to_dataframe()
+    df.iloc[0, 0] = -1
+
+    second = run_cached_query(db_path, "SELECT id, name FROM t")
+    assert second.columns == ["id", "name"]
+    assert second.column_data[0][0] == 0
+
+
+def test_spill_runs_without_the_lock(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "RESULT_CACHE_SPILL_DIR", str(tmp_path / "spill"))
+    monkeypatch.setattr(Config, "RESULT_CACHE_MAX_BYTES", 1)
+    held = []
+    dump = result_cache.pickle.dump
+
+    def checking_dump(*args, **kwargs):
+        acquired = result_cache._lock.acquire(blocking=False)
+        held.append(not acquired)
+        if acquired:
+            result_cache._lock.release()
+        return dump(*args, **kwargs)
+
+    monkeypatch.setattr(result_cache.pickle, "dump", checking_dump)
+    run_cached_query(db_path, "SELECT id FROM t")
+    run_cached_query(db_path, "SELECT name FROM t")
+    assert held == [False]
@@ -0,0 +1,26 @@
+import base64
+import json
+import pytest
+from app.functions.result_pages import CursorExpired, fetch_page
+
+
+def token(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "MQ",  # the JSON number 1
+    token([1, 2]),
+    token({"h": 1, "o": 0}),
+    token({"h": "abc", "o": "0"}),
+    token({"h": "abc"}),
+    "not base64!",
+])
+def test_malformed_cursor_is_expired(cursor):
+    with pytest.raises(CursorExpired):
+        fetch_page(cursor)
+
+
+def test_unknown_cursor_is_expired():
+    with pytest.raises(CursorExpired):
+        fetch_page(token({"h": "abc", "o": 0}))
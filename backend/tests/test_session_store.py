@@ -0,0 +1,25 @@
+import pytest
+from app.functions.session_store import is_refinement
+
+TABLES = ["orders", "customers"]
+
+
+@pytest.mark.parametrize("question", [
+    "Show the rows with amount over 100",
+    "List the records where city is Paris",
+    "Only products that shipped in 2024",
+    "How many orders per customer?",
+])
+def test_new_questions_are_not_refinements(question):
+    assert not is_refinement(question, TABLES)
+
+
+@pytest.mark.parametrize("question", [
+    "Sort those by amount",
+    "Now only 2024",
+    "What about Paris?",
+    "Which of these have amount over 100?",
+    "Show the previous results by month",
+])
+def test_follow_ups_are_refinements(question):
+    assert is_refinement(question, TABLES)
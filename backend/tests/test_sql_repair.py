@@ -0,0 +1,11 @@
+from app.functions.sql_repair import clean_sql
+
+
+def test_inner_semicolon_is_removed():
+    assert clean_sql("SELECT * FROM (SELECT id FROM t;) AS s;") == (
+        "SELECT * FROM (SELECT id FROM t) AS s", ["inner_semicolon", "trailing_semicolon"])
+
+
+def test_semicolon_inside_literal_is_kept():
+    sql = "SELECT * FROM t WHERE note = 'hi ;) there'"
+    assert clean_sql(sql) == (sql, [])
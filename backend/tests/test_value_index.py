@@ -0,0 +1,36 @@
+from app.functions.value_index import ValueIndex, snap_literals
+
+
+def make_index():
+    return ValueIndex((0, 0), [
+        ("orders", "order_date", ["2024-03-23", "2024-03-29"]),
+        ("orders", "status", ["Active", "Cancelled", "On Hold"]),
+        ("orders", "sku", ["SKU-104", "SKU-105"]),
+        ("customers", "city", ["Paris", "Parma", "London"]),
+    ])
+
+
+def test_date_literal_is_not_snapped_to_another_day():
+    sql = "SELECT * FROM orders WHERE order_date = '2024-03-30'"
+    assert snap_literals(make_index(), sql) == (sql, [])
+
+
+def test_code_literal_is_not_snapped():
+    sql = "SELECT * FROM orders WHERE sku = 'SKU-106'"
+    assert snap_literals(make_index(), sql) == (sql, [])
+
+
+def test_case_and_whitespace_are_folded():
+    sql, changes = snap_literals(make_index(), "SELECT * FROM orders WHERE status IN ('active', 'on  hold')")
+    assert sql == "SELECT * FROM orders WHERE status IN ('Active', 'On Hold')"
+    assert len(changes) == 2
+
+
+def test_misspelled_word_snaps_to_its_only_close_match():
+    sql, _ = snap_literals(make_index(), "SELECT * FROM customers WHERE city = 'Londn'")
+    assert sql == "SELECT * FROM customers WHERE city = 'London'"
+
+
+def test_ambiguous_misspelling_is_left_alone():
+    sql = "SELECT * FROM customers WHERE city = 'Parim'"
+    assert snap_literals(make_index(), sql) == (sql, [])
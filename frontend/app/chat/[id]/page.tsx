@@ -24,6 +24,7 @@ function NewChatContent({ chatId }: Props) {
   const [isUploadDialogOpen, setIsUploadDialogOpen] = useState(false)
   const [schema, setSchema] = useState<any>(null)
   const [isAlreadyUploaded, setIsAlreadyUploaded] = useState(false)
+  const [messagesBefore, setMessagesBefore] = useState<string | null>(null)
   const searchParams = useSearchParams()
   const initialQuery = searchParams.get("query")
 
@@ -39,6 +40,7 @@ function NewChatContent({ chatId }: Props) {
             timestamp: new Date(msg.timestamp),
           }))
           setMessages(parsedMessages)
+          setMessagesBefore(data.messages_before)
         }
   
         if (!data.database_uploaded) {
@@ -65,6 +67,38 @@ function NewChatContent({ chatId }: Props) {
     }
   }, [initialQuery, schema])
 
+  // Older messages are read a page at a time, newest first
+  const loadEarlierMessages = async () => {
+    if (!messagesBefore) return
+    try {
+      const res = await fetch(`${API_BASE_URL}/project/${chatId}/messages?before=${encodeURIComponent(messagesBefore)}`)
+      const data = await res.json()
+      if (data.messages) {
+        const parsedMessages = data.messages.map((msg: any) => ({
+          ...msg,
+          timestamp: new Date(msg.timestamp),
+        }))
+        setMessages((prev) => [...parsedMessages, ...prev])
+        setMessagesBefore(data.before)
+      }
+    } catch (error) {
+      console.error("Error fetching earlier messages:", error)
+    }
+  }
+
+  // Stored messages come without agentSteps and tableData; fetch them when a message is opened
+  const loadMessageDetails = async (messageId: string) => {
+    try {
+      const res = await fetch(`${API_BASE_URL}/project/${chatId}/messages/${messageId}`)
+      const details = await res.json()
+      if (!details.error) {
+        setMessages((prev) => prev.map((msg) => (msg._id === messageId ? { ...msg, ...details } : msg)))
+      }
+    } catch (error) {
+      console.error("Error fetching message details:", error)
+    }
+  }
+
   const fetchSchema = async () => {
     try {
       const response = await fetch(`${API_BASE_URL}/chat/schema`)
@@ -118,6 +152,20 @@ function NewChatContent({ chatId }: Props) {
       console.log(assistantMessage)
 
       setMessages((prev) => [...prev, assistantMessage])
+
+      // The chart is rendered in the background; fill it in once it's ready
+      if (data.visualizationId && !data.visualization) {
+        fetch(`http://127.0.0.1:8000/chart/${data.visualizationId}?wait=true`)
+          .then((res) => res.json())
+          .then((chart) => {
+            if (chart.url) {
+              setMessages((prev) =>
+                prev.map((msg) => (msg.id === assistantMessage.id ? { ...msg, visualization: chart.url } : msg)),
+              )
+            }
+          })
+          .catch((error) => console.error("Error fetching visualization:", error))
+      }
       
     } catch (error) {
       console.error("Error processing query:", error)
@@ -248,6 +296,9 @@ function NewChatContent({ chatId }: Props) {
             onSendMessage={handleSendMessage} 
             isProcessing={isProcessing} 
             isAlreadyUploaded={isAlreadyUploaded}
+            hasEarlierMessages={!!messagesBefore}
+            onLoadEarlier={loadEarlierMessages}
+            onLoadDetails={loadMessageDetails}
           />
         )}
       </div>
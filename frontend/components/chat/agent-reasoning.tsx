@@ -24,21 +24,32 @@ export interface AgentReasoning {
 
 interface AgentReasoningProps {
   reasoning: AgentReasoning
+  // Given when the steps and table rows are not loaded yet; called the first time either is opened
+  onLoadDetails?: () => void
 }
 
-export function AgentReasoning({ reasoning }: AgentReasoningProps) {
-  const [isThinkingOpen, setIsThinkingOpen] = useState(true)
+export function AgentReasoning({ reasoning, onLoadDetails }: AgentReasoningProps) {
+  const [isThinkingOpen, setIsThinkingOpen] = useState(!onLoadDetails)
+
+  const handleThinkingOpenChange = (open: boolean) => {
+    if (open && onLoadDetails) onLoadDetails()
+    setIsThinkingOpen(open)
+  }
+
+  const handleTabChange = (tab: string) => {
+    if (tab === "results" && onLoadDetails) onLoadDetails()
+  }
 
   return (
     <div className="space-y-4 w-full">
-      <Collapsible open={isThinkingOpen} onOpenChange={setIsThinkingOpen} className="w-full">
+      <Collapsible open={isThinkingOpen} onOpenChange={handleThinkingOpenChange} className="w-full">
         <div className="flex items-center justify-between mb-2">
           <CollapsibleTrigger asChild>
             <Button variant="outline" size="sm" className="gap-2">
               <Brain className="h-4 w-4" />
               AI Reasoning Process
               <span className="ml-1 text-xs bg-blue-100 text-blue-800 px-1.5 py-0.5 rounded-full">
-                {reasoning.currentStep}/{reasoning.steps.length}
+                {reasoning.currentStep}/{reasoning.steps.length || reasoning.currentStep}
               </span>
             </Button>
           </CollapsibleTrigger>
@@ -52,7 +63,7 @@ export function AgentReasoning({ reasoning }: AgentReasoningProps) {
         </CollapsibleContent>
       </Collapsible>
 
-      <Tabs defaultValue="explanation" className="w-full">
+      <Tabs defaultValue="explanation" className="w-full" onValueChange={handleTabChange}>
         <TabsList className="grid grid-cols-4 mb-4">
           <TabsTrigger value="explanation" className="flex items-center gap-2">
             <Database className="h-4 w-4" />
@@ -14,6 +14,7 @@ import { ReportDialog } from "@/components/report/report-dialog"
 
 export interface Message {
   id?: string
+  _id?: string
   role: "user" | "assistant"
   content: string
   timestamp?: Date | string
@@ -22,6 +23,9 @@ export interface Message {
   sqlQuery?: string
   explanation?: string
   tableData?: any[]
+  // Set on stored messages, whose agentSteps and tableData are fetched on demand
+  tableRowCount?: number
+  stepCount?: number
   tableColumns?: { key: string; label: string }[]
   visualization?: string
   followUpSuggestions?: string[]
@@ -32,9 +36,20 @@ interface MessageInterfaceProps {
   chatId: string
   onSendMessage: (message: string) => void
   isProcessing: boolean
+  hasEarlierMessages?: boolean
+  onLoadEarlier?: () => void
+  onLoadDetails?: (messageId: string) => void
 }
 
-export function MessageInterface({ messages, chatId, onSendMessage, isProcessing }: MessageInterfaceProps) {
+export function MessageInterface({
+  messages,
+  chatId,
+  onSendMessage,
+  isProcessing,
+  hasEarlierMessages,
+  onLoadEarlier,
+  onLoadDetails,
+}: MessageInterfaceProps) {
   const [inputValue, setInputValue] = useState("")
   const [isReportDialogOpen, setIsReportDialogOpen] = useState(false)
 
@@ -63,6 +78,13 @@ export function MessageInterface({ messages, chatId, onSendMessage, isProcessing
     <div className="flex flex-col h-full">
       <ScrollArea className="flex-1 p-4">
         <div className="max-w-4xl mx-auto space-y-8">
+          {hasEarlierMessages && onLoadEarlier && (
+            <div className="flex justify-center">
+              <Button variant="outline" size="sm" className="text-xs" onClick={onLoadEarlier}>
+                Load earlier messages
+              </Button>
+            </div>
+          )}
           {messages.map((message) => (
             <div key={message.id} className="animate-in fade-in-50 duration-300">
               {message.role === "user" ? (
@@ -83,7 +105,7 @@ export function MessageInterface({ messages, chatId, onSendMessage, isProcessing
                     {message && (
                       <AgentReasoning
                         reasoning={{
-                          steps: message.agentSteps,
+                          steps: message.agentSteps || [],
                           currentStep: message.currentStep,
                           sqlQuery: message.sqlQuery || "",
                           explanation: message.explanation || "",
@@ -91,6 +113,11 @@ export function MessageInterface({ messages, chatId, onSendMessage, isProcessing
                           tableColumns: message.tableColumns || [],
                           visualization: message.visualization || "none",
                         }}
+                        onLoadDetails={
+                          message._id && !message.agentSteps && onLoadDetails
+                            ? () => onLoadDetails(message._id as string)
+                            : undefined
+                        }
                       />
                     )}
 